@@ -1,8 +1,16 @@
-import json
+import gzip
+import io
 import os
 import sys
 import time
 
+from json_codec import JsonCodec
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # This is the abstract superclass of the several classes in this project -
 # SearchClient, Schemas, Urls.
 #
@@ -47,18 +55,39 @@ class BaseClass:
         return 'AccountEndpoint=https://{}.documents.azure.com;AccountKey={};Database={};ApiKind=MongoDb;'.format(
             acct, key, dbname)
 
+    def open_text_file(self, filename, mode='rt', level=None):
+        # files with a '.gz' or '.zst' extension are compressed and decompressed as streams
+        mode = mode.replace('t', '')
+        name = filename.lower()
+        if name.endswith('.gz'):
+            if 'r' in mode:
+                return gzip.open(filename, mode + 't', encoding='utf-8')
+            return gzip.open(filename, mode + 't', encoding='utf-8',
+                compresslevel=(level if level != None else 6))
+        if name.endswith('.zst'):
+            if zstandard == None:
+                raise ValueError('the zstandard library is required for {}'.format(filename))
+            if 'r' in mode:
+                stream = zstandard.ZstdDecompressor().stream_reader(
+                    open(filename, 'rb'), read_across_frames=True, closefd=True)
+            else:
+                compressor = zstandard.ZstdCompressor(level=(level if level != None else 3))
+                stream = compressor.stream_writer(open(filename, mode + 'b'), closefd=True)
+            return io.TextIOWrapper(stream, encoding='utf-8')
+        return open(filename, mode + 't', encoding='utf-8')
+
     def read_text_file(self, infile):
         lines = list()
-        with open(infile, 'rt') as f:
+        with self.open_text_file(infile, 'rt') as f:
             for idx, line in enumerate(f):
                 lines.append(line.strip())
         return lines
 
     def load_json_file(self, infile):
-        with open(infile, 'rt') as json_file:
-            return json.loads(str(json_file.read()))
+        with self.open_text_file(infile, 'rt') as f:
+            return JsonCodec.loads(f.read())
 
-    def write_json_file(self, obj, outfile):
-        with open(outfile, 'wt') as f:
-            f.write(json.dumps(obj, sort_keys=False, indent=2))
-            print('file written: {}'.format(outfile))
+    def write_json_file(self, obj, outfile, pretty=True, level=None):
+        with self.open_text_file(outfile, 'wt', level) as f:
+            f.write(JsonCodec.dumps(obj, pretty=pretty))
+        print('file written: {}'.format(outfile))
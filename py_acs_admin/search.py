@@ -49,6 +49,8 @@ Usage:
     python search.py search_index mongo-routes route_clt_rdu
     -
     python search.py lookup_doc mongo-airports eVBWc0FPdExvZzJYQXdBQUFBQUFBQT090
+    python search.py search_index mongo-routes route_clt_rdu --compact-json
+    python search.py list_indexes --compress zst --compress-level 9
 """
 
 import json
@@ -62,6 +64,7 @@ import requests
 from docopt import docopt
 
 from base import BaseClass
+from json_codec import JsonCodec
 from schemas import Schemas
 from urls import Urls
 
@@ -273,11 +276,11 @@ class SearchClient(BaseClass):
         r = requests.post(url=url, headers=self.admin_headers, json=search_params)
         print('response: {}'.format(r))
         if r.status_code == 200:
-            resp_obj = json.loads(r.text)
+            resp_obj = JsonCodec.loads(r.content)
             print(json.dumps(resp_obj, sort_keys=False, indent=2))
             print('response document count: {}'.format(resp_obj['@odata.count']))
-            outfile = 'tmp/search_{}.json'.format(search_name)
-            self.write_json_file(resp_obj, outfile)
+            outfile = self.artifact_file('search_{}'.format(search_name))
+            self.write_artifact(resp_obj, outfile)
 
     def named_searches_dict(self):
         if False:
@@ -337,7 +340,7 @@ class SearchClient(BaseClass):
             if r.status_code < 300:
                 try:
                     # Save the request and response data as a json file in tmp/
-                    outfile  = 'tmp/{}_{}.json'.format(function_name, int(self.epoch()))
+                    outfile  = self.artifact_file('{}_{}'.format(function_name, int(self.epoch())))
                     data = dict()
                     data['function_name'] = function_name
                     data['method'] = method
@@ -346,10 +349,10 @@ class SearchClient(BaseClass):
                     data['filename'] = outfile
                     data['resp_status_code'] = r.status_code
                     try:
-                        data['resp_obj'] = r.json()
+                        data['resp_obj'] = JsonCodec.loads(r.content)
                     except:
                         pass # this is expected as some requests don't return a response, like http 204
-                    self.write_json_file(data, outfile)
+                    self.write_artifact(data, outfile)
                 except Exception as e:
                     print("exception saving http response".format(e))
                     print(traceback.format_exc())
@@ -360,14 +363,30 @@ class SearchClient(BaseClass):
     def epoch(self):
         return time.time()
     
-    def write_json_file(self, obj, outfile):
-        with open(outfile, 'wt') as f:
-            f.write(json.dumps(obj, sort_keys=False, indent=2))
-            print('file written: {}'.format(outfile))
-
-    def load_json_file(self, infile):
-        with open(infile, 'rt') as json_file:
-            return json.loads(str(json_file.read()))
+    def artifact_file(self, basename):
+        # the tmp/ response files are compressed with --compress gz or --compress zst
+        ext = self.str_arg('--compress', None)
+        if ext != None:
+            return 'tmp/{}.json.{}'.format(basename, ext)
+        return 'tmp/{}.json'.format(basename)
+
+    def write_artifact(self, obj, outfile):
+        level = self.str_arg('--compress-level', None)
+        level = int(level) if level != None else None
+        self.write_json_file(obj, outfile, not self.compact_json(), level)
+
+    def str_arg(self, flag, default):
+        for idx, arg in enumerate(sys.argv):
+            if arg == flag and (idx + 1) < len(sys.argv):
+                return sys.argv[idx + 1]
+        return default
+
+    def compact_json(self):
+        # write the tmp/ response files as compact rather than indented JSON
+        for arg in sys.argv:
+            if arg == '--compact-json':
+                return True
+        return False
 
     def no_http(self):
         for arg in sys.argv:
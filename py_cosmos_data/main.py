@@ -3,15 +3,58 @@ Usage:
   python main.py <func> <args>
   python main.py wrangle_openflights_data
   python main.py wrangle_openflights_data | grep written
+  python main.py wrangle_openflights_data --jsonl
+  python main.py wrangle_openflights_data --jsonl --compact-routes
+  python main.py wrangle_openflights_data --compact-routes --airport-fields name,city,country
+  python main.py wrangle_openflights_data --jsonl --seed 42 --name-pool-size 10000
+  python main.py wrangle_openflights_data --jsonl --bearing
+  python main.py wrangle_openflights_data --jsonl --columnar
+  python main.py wrangle_openflights_data --jsonl --processes 8 --chunk-size-kb 256
+  python main.py wrangle_openflights_data --compact-json
+  python main.py wrangle_openflights_data --jsonl --compress zst --compress-level 9
   -
   python main.py load_airport_data <db> <coll>
   python main.py load_airport_data dev airports
+  python main.py load_airport_data dev airports --bulk --batch-size 500
+  python main.py load_airport_data dev airports --bulk --jsonl
+  python main.py load_airport_data dev airports --bulk --columnar
   -
   python main.py load_route_data <db> <coll>
   python main.py load_route_data dev routes
+  python main.py load_route_data dev routes --bulk --batch-size 500
+  python main.py load_route_data dev routes --bulk --batch-size 500 --ru-per-sec 4000
+  python main.py load_route_data dev routes --workers 8 --batch-size 500
+  python main.py load_route_data dev routes --workers 8 --jsonl
+  python main.py load_route_data dev routes --workers 8 --jsonl --mmap
+  python main.py load_route_data dev routes --workers 8 --jsonl --compress zst
+  python main.py load_route_data dev routes --bulk --stream
+  python main.py load_route_data dev routes --workers 8 --columnar
+  python main.py load_route_data dev routes --workers 8 --jsonl --idempotent
+  python main.py load_route_data dev routes --workers 8 --jsonl --resume
+  -
+  python main.py benchmark_loaders <db> <coll> --standin --latency-ms 2
+  python main.py benchmark_loaders bench docs --conn-string mongodb://localhost:27017
+  python main.py benchmark_loaders bench docs --standin --count 20000 --doc-size 2048 --workers 8
+  -
+  python main.py export_collection <db> <coll>
+  python main.py export_collection dev routes --outfile tmp/routes.jsonl.gz --page-size 2000
+  python main.py export_collection dev airports --fields pk,name,city,country --resume
+  python main.py export_collection dev routes --workers 8
+  python main.py export_collection dev routes --workers 8 --split-field pk --resume
+  -
+  python main.py sync_search_index <db> <coll> <index_name>
+  python main.py sync_search_index dev routes mongo-routes-push --index-schema ../py_acs_admin/schemas/mongo_routes_index.json
+  python main.py sync_search_index test routes routes --conn-string mongodb://localhost:27017/?replicaSet=rs0 --search-url http://localhost:8080
+  -
+  python main.py capacity_report
+  python main.py capacity_report --workers 16
   -
   python main.py count_docs dev routes
+  python main.py count_docs dev routes --pool-size 200 --compressors zlib
+  python main.py load_route_data dev routes --bulk --metrics --metrics-interval 10
   python main.py truncate_container dev routes
+  python main.py truncate_container dev routes --workers 4 --batch-size 1000
+  python main.py truncate_container dev routes --drop
 Options:
   -h --help     Show this screen.
   --version     Show version.
@@ -23,16 +66,40 @@ Options:
 #
 # Chris Joakim, Microsoft
 
+import collections
+import itertools
 import json
+import os
 import sys
+import time
 import uuid
 
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
 from docopt import docopt
-from faker import Faker
 
+from pysrc.benchmark import LoaderBenchmark, StandInMongo
+from pysrc.bulk_loader import BulkLoader
+from pysrc.capacity_report import CapacityReport
+from pysrc.checkpoint import Checkpoint
+from pysrc.columnar import ColumnarStore
+from pysrc.concurrent_loader import ConcurrentLoader
 from pysrc.env import Env
+from pysrc.exporter import CollectionExporter, ParallelCollectionExporter
 from pysrc.fs import FS
+from pysrc.geo import Geo
+from pysrc.json_codec import JsonCodec
+from pysrc.name_pool import NamePool
+from pysrc.rate_governor import RateGovernor
+from pysrc.search_sync import ChangeStreamSearchSync
+from pysrc.truncator import Truncator
 from pysrc.mongo import Mongo, MongoDBInstance, MongoDBDatabase, MongoDBCollection
+from pysrc.mongo_metrics import MongoMetrics
+
+mongo_metrics = None  # the optional MongoMetrics shared by all Mongo objects, see --metrics
+wrangle_worker_state = dict()  # per-process state of the --processes wrangle workers
 
 def print_options(msg):
     print(msg)
@@ -41,13 +108,61 @@ def print_options(msg):
 
 def wrangle_openflights_data():
     print('wrangle_openflights_data')
-    parsed_airports, enhanced_routes = dict(), list()
-    fake = Faker()
+    processes = int_arg('--processes', 1)
+    if processes > 1 and (FS.compression(airports_source_file()) != None or \
+            FS.compression(routes_source_file()) != None):
+        # compressed files can't be split into byte ranges
+        print('compressed source files are wrangled in one process')
+        processes = 1
+    pool_args = (int_arg('--name-pool-size', 10000), int_arg('--seed', 42))
+
+    if processes > 1:
+        # the chunk results are merged in file order, so the output matches a serial run
+        parsed_airports = dict()
+        for chunk_airports in map_file_chunks(airports_source_file(), parse_airports_chunk, processes):
+            parsed_airports.update(chunk_airports)
+    else:
+        parsed_airports = parse_airport_lines(FS.text_file_iterator(airports_source_file()))
+
+    FS.write_json(parsed_airports, enhanced_airports_file(), pretty=not compact_json_mode())
+    print('{} airports parsed'.format(len(parsed_airports)))
+
+    route_airports = parsed_airports
+    if compact_routes_mode():
+        # embed only the airport key and the projected fields in each route
+        fields = compact_airport_fields()
+        print('compact routes with airport fields: {}'.format(fields))
+        route_airports = dict()
+        for iata, airport in parsed_airports.items():
+            route_airports[iata] = project_airport(airport, fields)
 
-    lines = FS.read_lines('data/openflights/json/airports.json')
+    if processes > 1:
+        routes = parallel_enhanced_routes(route_airports, pool_args, processes)
+    else:
+        routes = enhanced_routes(route_airports, NamePool(*pool_args))
+    routes = with_route_distances(routes, parsed_airports, int_arg('--geo-chunk-size', 10000))
+    if columnar_mode():
+        # the columnar store is written from the complete lists, alongside the JSON
+        routes = list(routes)
+        airports = [parsed_airports[key] for key in sorted(parsed_airports.keys())]
+        ColumnarStore.write(airports, enhanced_airports_columnar_dir())
+        ColumnarStore.write(routes, enhanced_routes_columnar_dir())
+    if jsonl_mode():
+        # stream one compact document per line as the routes are produced
+        airports = (parsed_airports[key] for key in sorted(parsed_airports.keys()))
+        FS.write_jsonl(airports, enhanced_airports_jsonl_file())
+        count = FS.write_jsonl(routes, enhanced_routes_jsonl_file())
+    else:
+        routes = list(routes)
+        FS.write_json(routes, enhanced_routes_file(), pretty=not compact_json_mode())
+        count = len(routes)
+    print('{} enhanced_routes written'.format(count))
+
+def parse_airport_lines(lines):
+    parsed_airports = dict()
     for line in lines:
         try:
-            airport = json.loads(line.strip())
+            airport = JsonCodec.loads(line)
             iata = airport['iata'].strip().upper()
             if len(iata) > 2:
                 parsed_airport = parse_airport(airport)
@@ -58,40 +173,121 @@ def wrangle_openflights_data():
                         print(json.dumps(parsed_airport, sort_keys=False, indent=2))
         except:
             pass
+    return parsed_airports
 
-    FS.write_json(parsed_airports, enhanced_airports_file())
-    print('{} airports parsed'.format(len(parsed_airports)))
-    airport_keys = parsed_airports.keys()
+def enhanced_routes(parsed_airports, pool):
+    """ Generator of the enhanced routes, read lazily from routes.json """
+    lines = FS.text_file_iterator(routes_source_file())
+    return enhance_route_lines(lines, parsed_airports, pool)
+
+def parallel_enhanced_routes(parsed_airports, pool_args, processes):
+    """ Generator of the enhanced routes, parsed in byte-range chunks by a process pool """
+    chunks = map_file_chunks(routes_source_file(), enhance_routes_chunk, processes,
+        init_route_worker, (parsed_airports, pool_args))
+    for routes in chunks:
+        for route in routes:
+            yield route
+
+def map_file_chunks(infile, func, processes, initializer=None, initargs=()):
+    # func(infile, start, end) is executed per newline-aligned byte range of the file;
+    # the results are yielded in the order of the ranges.  The ranges are at most
+    # --chunk-size-kb, and only processes * 2 of them are in flight at a time, so
+    # the memory of the parent is bounded regardless of the size of the file.
+    chunk_bytes = int_arg('--chunk-size-kb', 256) * 1024
+    count = max(processes * 4, (os.path.getsize(infile) // chunk_bytes) + 1)
+    ranges = FS.line_aligned_ranges(infile, count)
+    print('{} - {} chunks, {} processes'.format(infile, len(ranges), processes))
+    with ProcessPoolExecutor(max_workers=processes,
+            initializer=initializer, initargs=initargs) as executor:
+        pending = collections.deque()
+        for start, end in ranges:
+            if len(pending) >= processes * 2:
+                yield pending.popleft().result()
+            pending.append(executor.submit(func, infile, start, end))
+        while len(pending) > 0:
+            yield pending.popleft().result()
 
-    lines = FS.read_lines('data/openflights/json/routes.json')
+def init_route_worker(parsed_airports, pool_args):
+    # the read-only airport lookup and the NamePool are created once per process;
+    # NamePool.names_for is keyed by the route, so the names don't depend on the order
+    wrangle_worker_state['airports'] = parsed_airports
+    wrangle_worker_state['pool'] = NamePool(*pool_args)
+
+def parse_airports_chunk(infile, start, end):
+    return parse_airport_lines(FS.iter_lines_in_range(infile, start, end))
+
+def enhance_routes_chunk(infile, start, end):
+    lines = FS.iter_lines_in_range(infile, start, end)
+    airports, pool = wrangle_worker_state['airports'], wrangle_worker_state['pool']
+    return list(enhance_route_lines(lines, airports, pool))
+
+def enhance_route_lines(lines, parsed_airports, pool):
+    # in the parallel mode the line_idx is relative to the start of the chunk
     for line_idx, line in enumerate(lines):
         try:
-            route = json.loads(line.strip())
+            route = JsonCodec.loads(line)
             source_iata = route['source_airport'].strip().upper()
             dest_iata = route['dest_airport'].strip().upper()
-            if source_iata in airport_keys:
-                if dest_iata in airport_keys:
+            if source_iata in parsed_airports:
+                if dest_iata in parsed_airports:
                     route['pk'] = '{}:{}'.format(source_iata, dest_iata)
                     route['source_iata'] = source_iata
                     route['dest_iata']   = dest_iata
                     route['source_airport'] = parsed_airports[source_iata]
                     route['dest_airport'] = parsed_airports[dest_iata]
-                    route['frequent_passengers'] = list()
-                    if route['pk'] == 'CLT:RDU':
-                        route['frequent_passengers'].append('Chris Joakim')
-                    else:
-                        for n in range(3):
-                            route['frequent_passengers'].append(fake.name())
-                    enhanced_routes.append(route)                 
+                    route['frequent_passengers'] = gen_frequent_passengers_list(pool, route)
                     if source_iata == 'CLT':
                         print(json.dumps(route, sort_keys=False, indent=2))
+                    yield route
             else:
                 print('line {} - route airport key(s) not found {} {}'.format(
                     line_idx, source_iata, dest_iata))
         except Exception as e:
             print(e)
-    FS.write_json(enhanced_routes, enhanced_routes_file())
-    print('{} enhanced_routes written'.format(len(enhanced_routes)))
+
+def with_route_distances(routes, parsed_airports, chunk_size):
+    """
+    Generator which adds distance_km, and with --bearing the initial bearing_deg,
+    to the routes; computed with one vectorized pass per chunk of routes.
+    The full parsed_airports are used since compact routes may omit the coordinates.
+    """
+    bearing = boolean_arg('--bearing')
+    for chunk in chunked(routes, chunk_size):
+        coords = np.array([
+            [parsed_airports[r['source_iata']]['latitude'],
+             parsed_airports[r['source_iata']]['longitude'],
+             parsed_airports[r['dest_iata']]['latitude'],
+             parsed_airports[r['dest_iata']]['longitude']] for r in chunk], dtype=np.float64)
+        distances = np.round(Geo.haversine_km(*coords.T), 3).tolist()
+        bearings = None
+        if bearing:
+            bearings = np.round(Geo.initial_bearing(*coords.T), 2).tolist()
+        for idx, route in enumerate(chunk):
+            route['distance_km'] = distances[idx]
+            if bearings != None:
+                route['bearing_deg'] = bearings[idx]
+            yield route
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+def project_airport(airport, fields):
+    projected = dict()
+    projected['iata'] = airport['iata']
+    for field in fields:
+        if field in airport:
+            projected[field] = airport[field]
+    return projected
+
+def compact_airport_fields():
+    # the default projection matches the airport fields in mongo_routes_index.json
+    fields = str_arg('--airport-fields', 'name,city,country,tz')
+    return [f.strip() for f in fields.split(',') if len(f.strip()) > 0]
 
 def parse_airport(airport):
     try:
@@ -104,42 +300,215 @@ def parse_airport(airport):
     except Exception as e:
         return None
 
-def gen_frequent_passengers_list():
-    names = list()
-
-    return names
+def gen_frequent_passengers_list(pool, route):
+    if route['pk'] == 'CLT:RDU':
+        return ['Chris Joakim']
+    key = '{}|{}'.format(route['pk'], route.get('airline_id'))
+    return pool.names_for(key, 3)
 
 def load_airport_data(dbname, cname):
     print('load_airport_data - dbname: {}, cname: {}'.format(dbname, cname))
-    objects = FS.read_json(enhanced_airports_file())
-    print('{} enhanced_airports loaded from file'.format(len(objects)))
+    objects = airport_docs()
 
     m = get_mongo_object(dbname, cname, False)
+    governor = get_rate_governor(m)
+
+    if bulk_mode():
+        stats = bulk_load(m, objects, airport_id_fields(), governor, dbname, cname)
+        print('load_airport_data stats: {}'.format(json.dumps(stats)))
+        print('rate_governor stats: {}'.format(json.dumps(governor.stats())))
+        return
 
-    for idx, key in enumerate(sorted(objects.keys())):
+    for idx, obj in enumerate(objects):
         if idx < 999999:
             print('---')
-            obj = objects[key]
             obj['_id'] = str(uuid.uuid4())
             print(json.dumps(obj, sort_keys=False, indent=2))
-            result = m.insert_doc(obj)
+            result = governor.execute(lambda: m.insert_doc(obj))
             print(result.inserted_id)
 
 def load_route_data(dbname, cname):
     print('load_route_data - dbname: {}, cname: {}'.format(dbname, cname))
-    objects = FS.read_json(enhanced_routes_file())
-    print('{} enhanced_routes loaded from file'.format(len(objects)))
+    objects = route_docs()
 
     m = get_mongo_object(dbname, cname, False)
+    governor = get_rate_governor(m)
+
+    if bulk_mode():
+        stats = bulk_load(m, objects, route_id_fields(), governor, dbname, cname)
+        print('load_route_data stats: {}'.format(json.dumps(stats)))
+        print('rate_governor stats: {}'.format(json.dumps(governor.stats())))
+        return
 
     for idx, obj in enumerate(objects):
         if idx < 999999:
             print('---')
             obj['_id'] = str(uuid.uuid4())
             print(json.dumps(obj, sort_keys=False, indent=2))
-            result = m.insert_doc(obj)
+            result = governor.execute(lambda: m.insert_doc(obj))
             print(result.inserted_id)
 
+def airport_docs():
+    # --jsonl, --stream and --columnar return generators, so inserts begin while the file is read
+    if columnar_mode():
+        return ColumnarStore(enhanced_airports_columnar_dir()).iter_docs()
+    if jsonl_mode():
+        return FS.iter_jsonl(enhanced_airports_jsonl_file(), use_mmap=mmap_mode())
+    if stream_mode():
+        return FS.iter_json_values(enhanced_airports_file())
+    objects = FS.read_json(enhanced_airports_file())
+    print('{} enhanced_airports loaded from file'.format(len(objects)))
+    return [objects[key] for key in sorted(objects.keys())]
+
+def route_docs():
+    if columnar_mode():
+        return ColumnarStore(enhanced_routes_columnar_dir()).iter_docs()
+    if jsonl_mode():
+        return FS.iter_jsonl(enhanced_routes_jsonl_file(), use_mmap=mmap_mode())
+    if stream_mode():
+        return FS.iter_json_values(enhanced_routes_file())
+    objects = FS.read_json(enhanced_routes_file())
+    print('{} enhanced_routes loaded from file'.format(len(objects)))
+    return objects
+
+def with_new_id(obj):
+    obj['_id'] = str(uuid.uuid4())
+    return obj
+
+def with_deterministic_id(obj, id_fields):
+    # the same document always gets the same _id, so reloads upsert rather than duplicate
+    key = '|'.join([str(obj.get(field)) for field in id_fields])
+    obj['_id'] = str(uuid.uuid5(uuid.NAMESPACE_OID, key))
+    return obj
+
+def airport_id_fields():
+    return ['pk']
+
+def route_id_fields():
+    # pk is source:dest, and a source:dest pair is served by several airlines
+    return ['pk', 'airline_id', 'airline']
+
+def bulk_load(m, objects, id_fields, governor, dbname, cname):
+    opts = dict()
+    opts['batch_size'] = int_arg('--batch-size', 100)
+    opts['progress_interval'] = int_arg('--progress-interval', 1000)
+    opts['governor'] = governor
+    opts['workers'] = int_arg('--workers', 1)
+    opts['queue_size'] = int_arg('--queue-size', opts['workers'] * 2)
+
+    if idempotent_mode():
+        checkpoint = Checkpoint(checkpoint_file(dbname, cname))
+        start_offset = 0
+        if resume_mode():
+            start_offset = checkpoint.load()
+            print('resuming at input offset {} per {}'.format(start_offset, checkpoint_file(dbname, cname)))
+        opts['upsert'] = True
+        opts['checkpoint'] = checkpoint
+        opts['start_offset'] = start_offset
+        objects = itertools.islice(objects, start_offset, None)
+        docs = (with_deterministic_id(obj, id_fields) for obj in objects)
+    else:
+        docs = (with_new_id(obj) for obj in objects)
+
+    if opts['workers'] > 1:
+        return ConcurrentLoader(m, opts).load(docs)
+    return BulkLoader(m, opts).load(docs)
+
+def checkpoint_file(dbname, cname):
+    return 'tmp/checkpoint_{}_{}.json'.format(dbname, cname)
+
+def get_rate_governor(m):
+    # --ru-per-sec 0 (the default) disables pacing, but throttled writes are still retried
+    opts = dict()
+    opts['ru_per_sec'] = int_arg('--ru-per-sec', 0)
+    opts['sample_every'] = int_arg('--ru-sample-every', 50)
+    opts['max_retries'] = int_arg('--max-retries', 10)
+    return RateGovernor(m, opts)
+
+def benchmark_loaders(dbname, cname):
+    print('benchmark_loaders - dbname: {}, cname: {}'.format(dbname, cname))
+    if boolean_arg('--standin'):
+        m = StandInMongo(float(str_arg('--latency-ms', '0')))
+        m.set_db(dbname)
+        m.set_coll(cname)
+    else:
+        m = get_mongo_object(dbname, cname, False)
+        if m.is_cosmos() and not boolean_arg('--allow-cosmos'):
+            # the benchmark drops the collection between modes
+            print('benchmark_loaders - refusing to run against CosmosDB without --allow-cosmos')
+            return
+
+    opts = dict()
+    opts['cname'] = cname
+    opts['count'] = int_arg('--count', 10000)
+    opts['doc_size'] = int_arg('--doc-size', 1024)
+    opts['batch_size'] = int_arg('--batch-size', 100)
+    opts['workers'] = int_arg('--workers', 4)
+    opts['modes'] = str_arg('--modes', ','.join(LoaderBenchmark.MODES)).split(',')
+    results = LoaderBenchmark(m, opts).run()
+
+    print('')
+    print('{:<12} {:>10} {:>12} {:>10} {:>10} {:>10} {:>10}'.format(
+        'mode', 'docs', 'docs/sec', 'p50 ms', 'p90 ms', 'p99 ms', 'rss mb'))
+    for r in results:
+        print('{:<12} {:>10} {:>12} {:>10} {:>10} {:>10} {:>10}'.format(
+            r['mode'], r['count'], r['docs_per_sec'], r['latency_ms_p50'],
+            r['latency_ms_p90'], r['latency_ms_p99'], r['rss_mb']))
+    FS.write_json(results, 'tmp/benchmark_loaders_{}.json'.format(int(time.time())))
+
+def export_collection(dbname, cname):
+    print('export_collection - dbname: {}, cname: {}'.format(dbname, cname))
+    m = get_mongo_object(dbname, cname, False)
+    opts = dict()
+    opts['outfile'] = str_arg('--outfile', 'tmp/export_{}_{}.jsonl.gz'.format(dbname, cname))
+    opts['page_size'] = int_arg('--page-size', 1000)
+    opts['cursor_batch_size'] = optional_int_arg('--cursor-batch-size')
+    opts['compress_level'] = int_arg('--compress-level', 6)
+    opts['progress_interval'] = int_arg('--progress-interval', 10000)
+    opts['resume'] = resume_mode()
+    fields = str_arg('--fields', None)
+    if fields != None:
+        opts['fields'] = [f.strip() for f in fields.split(',') if len(f.strip()) > 0]
+    opts['workers'] = int_arg('--workers', 1)
+    if opts['workers'] > 1:
+        # range-partitioned export, with one shard file per range
+        opts['split_field'] = str_arg('--split-field', '_id')
+        opts['sample_size'] = int_arg('--sample-size', 1000)
+        manifest = ParallelCollectionExporter(m, opts).run()
+        print('export_collection count: {}, complete: {}'.format(manifest['count'], manifest['complete']))
+    else:
+        state = CollectionExporter(m, opts).run()
+        print('export_collection state: {}'.format(state))
+
+def sync_search_index(dbname, cname, index_name):
+    print('sync_search_index - dbname: {}, cname: {}, index: {}'.format(dbname, cname, index_name))
+    m = get_mongo_object(dbname, cname, False)
+    opts = dict()
+    opts['index_name'] = index_name
+    opts['search_url'] = str_arg('--search-url', Env.var('AZURE_SEARCH_URL'))
+    opts['search_admin_key'] = str_arg('--search-key', Env.var('AZURE_SEARCH_ADMIN_KEY'))
+    opts['index_schema'] = str_arg('--index-schema', None)
+    opts['batch_size'] = int_arg('--batch-size', 500)
+    opts['max_wait'] = float(str_arg('--max-wait', '2.0'))
+    opts['state_file'] = 'tmp/sync_{}_{}_{}.json'.format(dbname, cname, index_name)
+    try:
+        stats = ChangeStreamSearchSync(m, opts).run(optional_int_arg('--max-changes'))
+        print('sync_search_index stats: {}'.format(json.dumps(stats)))
+    except KeyboardInterrupt:
+        print('sync_search_index - interrupted')
+
+def capacity_report():
+    print('capacity_report')
+    opts = dict()
+    opts['inventory_workers'] = int_arg('--workers', 8)
+    opts['workers'] = opts['inventory_workers']
+    instance = MongoDBInstance(get_conn_string(), opts)
+    report = CapacityReport(instance, opts).run()
+    for row in report['collections']:
+        print('{}.{} - count: {}, size: {}, avg_obj_size: {}, indexes: {}, size_delta: {}'.format(
+            row['db'], row['coll'], row['count'], row['size_human'],
+            row['avg_obj_size_human'], row['total_index_size_human'], row['size_delta_human']))
+
 def count_docs(dbname, cname):
     print('count_docs - dbname: {}, cname: {}'.format(dbname, cname))
 
@@ -151,23 +520,31 @@ def truncate_container(dbname, cname):
     print('truncate_container - dbname: {}, cname: {}'.format(dbname, cname))
 
     m = get_mongo_object(dbname, cname, False)
-    continue_to_processs, loop_counter = True, 0
-    while continue_to_processs:
-        loop_counter  = loop_counter + 1
-        docs = m.find({}, 100)
-        for doc in docs:
-            m.delete_one(doc)
-        count_result  = m.count_docs({})
-        print('truncate_container - loop: {}, count: {}'.format(loop_counter, count_result))
-        if count_result == 0:
-            continue_to_processs = False
-        if loop_counter > 999:
-            continue_to_processs = False
+    opts = dict()
+    opts['cname'] = cname
+    opts['batch_size'] = int_arg('--batch-size', 1000)
+    opts['workers'] = int_arg('--workers', 1)
+    opts['partition_key'] = str_arg('--partition-key', 'pk')
+    opts['allow_drop'] = boolean_arg('--drop')
+    opts['governor'] = get_rate_governor(m)
+    stats = Truncator(m, opts).truncate()
+    print('truncate_container stats: {}'.format(json.dumps(stats)))
+    print('document count: {}'.format(m.estimated_count()))
 
 def get_mongo_object(dbname, cname, verbose=False):
     opts = dict()
     opts['conn_string'] = get_conn_string()
     opts['verbose'] = False
+    # optional MongoClient pool and timeout settings, see MongoClientRegistry
+    opts['pool_size'] = optional_int_arg('--pool-size')
+    opts['connect_timeout_ms'] = optional_int_arg('--connect-timeout-ms')
+    opts['socket_timeout_ms'] = optional_int_arg('--socket-timeout-ms')
+    opts['server_selection_timeout_ms'] = optional_int_arg('--server-selection-timeout-ms')
+    opts['compressors'] = str_arg('--compressors', None)
+    if boolean_arg('--no-retry-writes'):
+        opts['retry_writes'] = False
+    if boolean_arg('--metrics'):
+        opts['metrics'] = get_mongo_metrics()
     m = Mongo(opts)
     if dbname != None:
         m.set_db(dbname)
@@ -175,9 +552,20 @@ def get_mongo_object(dbname, cname, verbose=False):
             m.set_coll(cname)
     return m
 
+def get_mongo_metrics():
+    global mongo_metrics
+    if mongo_metrics == None:
+        opts = dict()
+        opts['outfile'] = str_arg('--metrics-file', 'tmp/mongo_metrics.json')
+        opts['export_interval'] = int_arg('--metrics-interval', 30)
+        opts['sample_every'] = int_arg('--metrics-sample-every', 100)
+        mongo_metrics = MongoMetrics(opts)
+    return mongo_metrics
+
 def get_conn_string():
     try:
-        conn_string = Env.var('AZURE_COSMOSDB_MONGODB_CONN_STRING')
+        # --conn-string can be used to target a local mongod
+        conn_string = str_arg('--conn-string', Env.var('AZURE_COSMOSDB_MONGODB_CONN_STRING'))
         if verbose():
             print("conn_string: {}".format(conn_string))
         return conn_string
@@ -185,11 +573,37 @@ def get_conn_string():
         print(e)
         return None
 
+def airports_source_file():
+    return FS.existing_variant('data/openflights/json/airports.json')
+
+def routes_source_file():
+    return FS.existing_variant('data/openflights/json/routes.json')
+
 def enhanced_airports_file():
-    return 'data/openflights/json/enhanced_airports.json'
+    return data_file('data/openflights/json/enhanced_airports.json')
 
 def enhanced_routes_file():
-    return 'data/openflights/json/enhanced_routes.json'
+    return data_file('data/openflights/json/enhanced_routes.json')
+
+def enhanced_airports_jsonl_file():
+    return data_file('data/openflights/json/enhanced_airports.jsonl')
+
+def enhanced_routes_jsonl_file():
+    return data_file('data/openflights/json/enhanced_routes.jsonl')
+
+def data_file(filename):
+    # with --compress gz or zst the file is written and read compressed; otherwise
+    # the plain file, or the compressed variant which exists, is used
+    ext = str_arg('--compress', None)
+    if ext != None:
+        return '{}.{}'.format(filename, ext)
+    return FS.existing_variant(filename)
+
+def enhanced_airports_columnar_dir():
+    return 'data/openflights/columnar/enhanced_airports'
+
+def enhanced_routes_columnar_dir():
+    return 'data/openflights/columnar/enhanced_routes'
 
 def verbose():
     for arg in sys.argv:
@@ -197,12 +611,63 @@ def verbose():
             return True
     return False
 
+def jsonl_mode():
+    return boolean_arg('--jsonl')
+
+def compact_routes_mode():
+    return boolean_arg('--compact-routes')
+
+def compact_json_mode():
+    return boolean_arg('--compact-json')
+
+def columnar_mode():
+    return boolean_arg('--columnar')
+
+def mmap_mode():
+    return boolean_arg('--mmap')
+
+def stream_mode():
+    return boolean_arg('--stream')
+
+def bulk_mode():
+    # the --workers n and --idempotent modes are implemented on top of the bulk loader
+    return boolean_arg('--bulk') or int_arg('--workers', 1) > 1 or idempotent_mode()
+
+def idempotent_mode():
+    return boolean_arg('--idempotent') or resume_mode()
+
+def resume_mode():
+    return boolean_arg('--resume')
+
+def boolean_arg(flag):
+    for arg in sys.argv:
+        if arg == flag:
+            return True
+    return False
+
+def int_arg(flag, default):
+    return int(str_arg(flag, default))
+
+def optional_int_arg(flag):
+    value = str_arg(flag, None)
+    return int(value) if value != None else None
+
+def str_arg(flag, default):
+    # supports both '--flag value' and '--flag=value' forms
+    for idx, arg in enumerate(sys.argv):
+        if arg == flag and (idx + 1) < len(sys.argv):
+            return sys.argv[idx + 1]
+        if arg.startswith(flag + '='):
+            return arg.split('=', 1)[1]
+    return default
+
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print_options('Error: no command-line args')
     else:
         func = sys.argv[1].lower()
+        FS.set_compress_level(optional_int_arg('--compress-level'))
         if func == 'wrangle_openflights_data':
             wrangle_openflights_data()
         elif func == 'load_airport_data':
@@ -211,6 +676,17 @@ if __name__ == "__main__":
         elif func == 'load_route_data':
             dbname, cname = sys.argv[2], sys.argv[3]
             load_route_data(dbname, cname)
+        elif func == 'benchmark_loaders':
+            dbname, cname = sys.argv[2], sys.argv[3]
+            benchmark_loaders(dbname, cname)
+        elif func == 'export_collection':
+            dbname, cname = sys.argv[2], sys.argv[3]
+            export_collection(dbname, cname)
+        elif func == 'sync_search_index':
+            dbname, cname, index_name = sys.argv[2], sys.argv[3], sys.argv[4]
+            sync_search_index(dbname, cname, index_name)
+        elif func == 'capacity_report':
+            capacity_report()
         elif func == 'count_docs':
             dbname, cname = sys.argv[2], sys.argv[3]
             count_docs(dbname, cname)
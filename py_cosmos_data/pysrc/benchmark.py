@@ -0,0 +1,199 @@
+import itertools
+import threading
+import time
+
+from pysrc.bulk_loader import BulkLoader
+from pysrc.concurrent_loader import ConcurrentLoader
+from pysrc.system import System
+
+# This class is used to measure the throughput of the loader code paths -
+# insert_one, batched, and concurrent - with synthetic documents of a given
+# size and count.  It is intended to be run against a local mongod, or the
+# in-process StandInMongo below, rather than against a CosmosDB account.
+# Reports docs/sec, per-request latency percentiles, and process RSS.
+#
+# Chris Joakim, Microsoft
+
+class LoaderBenchmark(object):
+
+    MODES = ['insert_one', 'batched', 'concurrent']
+
+    def __init__(self, mongo, opts):
+        self._m = mongo
+        self._opts = opts
+        self._cname = opts['cname']
+        self._count = int(opts.get('count', 10000))
+        self._doc_size = int(opts.get('doc_size', 1024))
+        self._batch_size = int(opts.get('batch_size', 100))
+        self._workers = int(opts.get('workers', 4))
+        self._modes = opts.get('modes', self.MODES)
+
+    def run(self):
+        results = list()
+        for mode in self._modes:
+            self.reset_collection()
+            results.append(self.run_mode(mode))
+        self.reset_collection()
+        return results
+
+    def run_mode(self, mode):
+        print('benchmark - mode: {}, count: {}, doc_size: {}'.format(mode, self._count, self._doc_size))
+        timed = LatencyRecorder(self._m)
+        rss_before = System.memory_info().rss
+        t1 = time.time()
+        if mode == 'insert_one':
+            for doc in self.synthetic_docs():
+                timed.insert_doc(doc)
+        else:
+            opts = dict()
+            opts['batch_size'] = self._batch_size
+            opts['progress_interval'] = max(self._count // 4, 1)
+            if mode == 'concurrent':
+                opts['workers'] = self._workers
+                ConcurrentLoader(timed, opts).load(self.synthetic_docs())
+            else:
+                BulkLoader(timed, opts).load(self.synthetic_docs())
+        elapsed = time.time() - t1
+        result = dict()
+        result['mode'] = mode
+        result['count'] = self._count
+        result['doc_size'] = self._doc_size
+        result['batch_size'] = self._batch_size if mode != 'insert_one' else 1
+        result['workers'] = self._workers if mode == 'concurrent' else 1
+        result['elapsed'] = round(elapsed, 3)
+        result['docs_per_sec'] = round(self._count / elapsed, 1) if elapsed > 0 else 0.0
+        result['requests'] = timed.count()
+        for p in [50, 90, 99]:
+            result['latency_ms_p{}'.format(p)] = timed.percentile(p)
+        result['latency_ms_max'] = timed.percentile(100)
+        result['rss_mb'] = round(System.memory_info().rss / 1048576.0, 1)
+        result['rss_delta_mb'] = round((System.memory_info().rss - rss_before) / 1048576.0, 1)
+        result['collection_count'] = self._m.estimated_count()
+        print('benchmark - result: {}'.format(result))
+        return result
+
+    def synthetic_docs(self):
+        # a generator, so that the documents are not all held in memory
+        filler = ('abcdefghijklmnopqrstuvwxyz0123456789' * ((self._doc_size // 36) + 1))
+        for n in range(self._count):
+            doc = dict()
+            doc['pk'] = 'bench-{:09d}'.format(n)
+            doc['seq'] = n
+            doc['payload'] = filler[:max(self._doc_size - 64, 0)]
+            yield doc
+
+    def reset_collection(self):
+        self._m.drop_coll(self._cname)
+        self._m.set_coll(self._cname)
+
+
+class LatencyRecorder(object):
+    """
+    Wraps a Mongo object and records the latency of its write methods.
+    """
+
+    def __init__(self, mongo):
+        self._m = mongo
+        self._latencies = list()
+        self._lock = threading.Lock()
+
+    def insert_doc(self, doc):
+        return self.timed(self._m.insert_doc, doc)
+
+    def insert_many(self, docs, ordered=False):
+        return self.timed(self._m.insert_many, docs, ordered)
+
+    def bulk_write(self, operations, ordered=False):
+        return self.timed(self._m.bulk_write, operations, ordered)
+
+    def timed(self, func, *args):
+        t1 = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            ms = (time.perf_counter() - t1) * 1000.0
+            with self._lock:
+                self._latencies.append(ms)
+
+    def count(self):
+        return len(self._latencies)
+
+    def percentile(self, p):
+        with self._lock:
+            values = sorted(self._latencies)
+        if len(values) == 0:
+            return 0.0
+        idx = min(len(values) - 1, max(0, int(round((p / 100.0) * len(values))) - 1))
+        return round(values[idx], 3)
+
+
+class StandInMongo(object):
+    """
+    An in-process stand-in for the Mongo class, implementing the subset of its
+    methods used by the loaders.  Documents are kept in a dict, and an optional
+    simulated per-request latency approximates the network round trip.
+    """
+
+    def __init__(self, latency_ms=0.0):
+        self._latency = float(latency_ms) / 1000.0
+        self._colls = dict()
+        self._coll = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def is_cosmos(self):
+        return False
+
+    def set_db(self, dbname):
+        return self
+
+    def set_coll(self, collname):
+        with self._lock:
+            if collname not in self._colls:
+                self._colls[collname] = dict()
+            self._coll = self._colls[collname]
+        return self._coll
+
+    def drop_coll(self, collname):
+        with self._lock:
+            self._colls.pop(collname, None)
+
+    def insert_doc(self, doc):
+        self.simulate_latency()
+        with self._lock:
+            self._coll[doc.setdefault('_id', next(self._ids))] = doc
+        return StandInResult([doc['_id']])
+
+    def insert_many(self, docs, ordered=False):
+        self.simulate_latency()
+        with self._lock:
+            for doc in docs:
+                self._coll[doc.setdefault('_id', next(self._ids))] = doc
+        return StandInResult([doc['_id'] for doc in docs])
+
+    def bulk_write(self, operations, ordered=False):
+        self.simulate_latency()
+        with self._lock:
+            for op in operations:
+                doc = op._doc
+                self._coll[doc['_id']] = doc
+        return StandInResult([None] * len(operations))
+
+    def estimated_count(self):
+        with self._lock:
+            return len(self._coll) if self._coll != None else 0
+
+    def last_request_request_charge(self):
+        raise Exception('getLastRequestStatistics is not supported by the stand-in')
+
+    def simulate_latency(self):
+        if self._latency > 0:
+            time.sleep(self._latency)
+
+
+class StandInResult(object):
+
+    def __init__(self, ids):
+        self.inserted_ids = ids
+        self.upserted_count = len(ids)
+        self.matched_count = 0
@@ -0,0 +1,154 @@
+import threading
+import time
+
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+# This class is used to load documents into a MongoDB/CosmosDB collection
+# in batches with unordered insert_many calls, rather than one insert_one
+# call per document.  Only progress counters are logged, not the documents.
+# An optional RateGovernor paces the batches and retries throttled documents.
+# With the upsert option the documents are written with ReplaceOne upserts,
+# so a load with deterministic _ids can be repeated or resumed idempotently;
+# an optional Checkpoint records the input offset of the committed batches.
+#
+# Chris Joakim, Microsoft
+
+class BulkLoader(object):
+
+    def __init__(self, mongo, opts):
+        self._m = mongo
+        self._opts = opts
+        self._batch_size = int(opts.get('batch_size', 100))
+        self._progress_interval = int(opts.get('progress_interval', 1000))
+        self._governor = opts.get('governor', None)  # optional RateGovernor
+        self._checkpoint = opts.get('checkpoint', None)  # optional Checkpoint
+        self._upsert = opts.get('upsert', False)
+        self._partition_key = opts.get('partition_key', 'pk')
+        self._offset = int(opts.get('start_offset', 0))
+        self._batch = list()
+        self._start_time = None
+        self._stats = dict()
+        self._stats['docs'] = 0
+        self._stats['written'] = 0
+        self._stats['failed'] = 0
+        self._stats['batches'] = 0
+        self._stats['failed_batches'] = 0
+        self._last_progress = 0
+        self._lock = threading.Lock()
+
+    def load(self, docs):
+        """ Load the given iterable of documents, return the stats dict. """
+        for doc in docs:
+            self.add(doc)
+        return self.finish()
+
+    def add(self, doc):
+        if self._start_time == None:
+            self._start_time = time.time()
+        self._batch.append(doc)
+        self._offset = self._offset + 1
+        self._stats['docs'] = self._stats['docs'] + 1
+        if len(self._batch) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self._batch) == 0:
+            return
+        batch, self._batch = self._batch, list()
+        self._stats['batches'] = self._stats['batches'] + 1
+        self.write_batch(batch, self._stats['batches'], self._offset)
+
+    def write(self, batch):
+        """ Write the batch, return the number of documents written. """
+        if self._upsert:
+            ops = list()
+            for doc in batch:
+                filter = {'_id': doc['_id']}
+                if self._partition_key in doc:
+                    filter[self._partition_key] = doc[self._partition_key]
+                ops.append(ReplaceOne(filter, doc, upsert=True))
+            result = self._m.bulk_write(ops, ordered=False)
+            return result.upserted_count + result.matched_count
+        result = self._m.insert_many(batch, ordered=False)
+        return len(result.inserted_ids)
+
+    def write_batch(self, batch, batch_num, end_offset):
+        batch_size, written, failed = len(batch), 0, 0
+        attempt = 0
+        while len(batch) > 0:
+            if self._governor != None:
+                self._governor.pace(len(batch))
+            try:
+                written = written + self.write(batch)
+                if self._governor != None:
+                    self._governor.record(len(batch))
+                batch = list()
+            except BulkWriteError as bwe:
+                details = bwe.details
+                errors = details.get('writeErrors', list())
+                written = written + details.get('nInserted', 0) + \
+                    details.get('nUpserted', 0) + details.get('nMatched', 0)
+                throttled, others = list(), list()
+                for error in errors:
+                    if self._governor != None and self._governor.is_throttled_write_error(error):
+                        throttled.append(error)
+                    else:
+                        others.append(error)
+                if len(others) > 0:
+                    failed = failed + len(others)
+                    print('batch {} - {} of {} docs failed; first error: {}'.format(
+                        batch_num, len(others), batch_size, others[0].get('errmsg')))
+                if len(throttled) > 0 and attempt < self._governor.max_retries():
+                    # retry only the throttled documents of this batch
+                    attempt = attempt + 1
+                    batch = [batch[error['index']] for error in throttled]
+                    self._governor.backoff(attempt, throttled[0].get('errmsg'))
+                else:
+                    failed = failed + len(throttled)
+                    batch = list()
+            except Exception as e:
+                if self._governor != None and self._governor.is_throttled(e) and \
+                        attempt < self._governor.max_retries():
+                    attempt = attempt + 1
+                    self._governor.backoff(attempt, e)
+                else:
+                    failed = failed + len(batch)
+                    print('batch {} - {} docs failed; error: {}'.format(
+                        batch_num, len(batch), str(e)))
+                    batch = list()
+        with self._lock:
+            self._stats['written'] = self._stats['written'] + written
+            if failed > 0:
+                self._stats['failed'] = self._stats['failed'] + failed
+                self._stats['failed_batches'] = self._stats['failed_batches'] + 1
+        if self._checkpoint != None:
+            self._checkpoint.commit(batch_num, end_offset, failed == 0)
+        self.log_progress()
+
+    def finish(self):
+        self.flush()
+        self.log_progress(True)
+        return self.stats()
+
+    def log_progress(self, force=False):
+        with self._lock:
+            processed = self._stats['written'] + self._stats['failed']
+            delta = processed - self._last_progress
+            if not ((force and delta > 0) or delta >= self._progress_interval):
+                return
+            self._last_progress = processed
+        s = self.stats()
+        print('progress - docs: {}, written: {}, failed: {}, batches: {}, failed_batches: {}, elapsed: {}, docs/sec: {}'.format(
+            s['docs'], s['written'], s['failed'], s['batches'],
+            s['failed_batches'], s['elapsed'], s['docs_per_sec']))
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        elapsed = 0.0
+        if self._start_time != None:
+            elapsed = time.time() - self._start_time
+        s['elapsed'] = round(elapsed, 3)
+        s['docs_per_sec'] = round(s['written'] / elapsed, 1) if elapsed > 0 else 0.0
+        return s
@@ -0,0 +1,151 @@
+import bson
+
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+# This class accumulates mixed insert, upsert, update and delete operations
+# for a collection, and executes them as unordered bulk_write batches.  A
+# batch is flushed when it reaches a maximum number of operations, or when
+# its cumulative BSON size would exceed the request size limit.  Results are
+# aggregated across the batches, including the per-operation errors.
+# Obtain an instance with Mongo.bulk_writer(); it can be used as a context
+# manager, which flushes on exit.
+#
+# Chris Joakim, Microsoft
+
+class MongoBulkWriter(object):
+
+    COSMOS_MAX_DOC_BYTES = 2 * 1024 * 1024  # the CosmosDB Mongo API document limit
+    REQUEST_OVERHEAD_BYTES = 16 * 1024
+
+    def __init__(self, mongo, opts=None):
+        opts = opts or dict()
+        self._m = mongo
+        self._max_ops = int(opts.get('max_ops', 1000))
+        self._max_bytes = int(opts.get(
+            'max_bytes', self.COSMOS_MAX_DOC_BYTES - self.REQUEST_OVERHEAD_BYTES))
+        self._governor = opts.get('governor', None)  # optional RateGovernor
+        self._ops = list()       # (global op index, kind, pymongo operation)
+        self._bytes = 0
+        self._op_count = 0
+        self._results = dict()
+        for name in ['inserted', 'matched', 'modified', 'deleted', 'upserted', 'batches', 'failed']:
+            self._results[name] = 0
+        self._errors = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.flush()
+        return False
+
+    def insert(self, doc):
+        self.add('insert', InsertOne(doc), doc)
+
+    def upsert(self, filter, doc):
+        self.add('upsert', ReplaceOne(filter, doc, upsert=True), filter, doc)
+
+    def replace(self, filter, doc, upsert=False):
+        self.add('replace', ReplaceOne(filter, doc, upsert=upsert), filter, doc)
+
+    def update(self, filter, update, upsert=False, many=False):
+        # 'update only works with $ operators'
+        if many:
+            self.add('update_many', UpdateMany(filter, update, upsert=upsert), filter, update)
+        else:
+            self.add('update', UpdateOne(filter, update, upsert=upsert), filter, update)
+
+    def delete(self, filter, many=False):
+        if many:
+            self.add('delete_many', DeleteMany(filter), filter)
+        else:
+            self.add('delete', DeleteOne(filter), filter)
+
+    def add(self, kind, operation, *parts):
+        op_index = self._op_count
+        self._op_count = self._op_count + 1
+        size = sum([len(bson.encode(part)) for part in parts])
+        if size > self._max_bytes:
+            # never sent; it would be rejected by the service
+            self._results['failed'] = self._results['failed'] + 1
+            self._errors.append(self.error_entry(
+                op_index, kind, None, 'operation size {} exceeds the limit of {} bytes'.format(
+                    size, self._max_bytes)))
+            return
+        if len(self._ops) > 0 and (self._bytes + size) > self._max_bytes:
+            self.flush()
+        self._ops.append((op_index, kind, operation))
+        self._bytes = self._bytes + size
+        if len(self._ops) >= self._max_ops:
+            self.flush()
+
+    def flush(self):
+        if len(self._ops) == 0:
+            return
+        ops, self._ops, self._bytes = self._ops, list(), 0
+        self._results['batches'] = self._results['batches'] + 1
+        attempt = 0
+        while len(ops) > 0:
+            if self._governor != None:
+                self._governor.pace(len(ops))
+            try:
+                result = self._m.bulk_write([op[2] for op in ops], ordered=False)
+                self.add_counts(result.bulk_api_result)
+                if self._governor != None:
+                    self._governor.record(len(ops))
+                ops = list()
+            except BulkWriteError as bwe:
+                self.add_counts(bwe.details)
+                throttled, throttle_msg = list(), None
+                for error in bwe.details.get('writeErrors', list()):
+                    op_index, kind, operation = ops[error['index']]
+                    if self._governor != None and self._governor.is_throttled_write_error(error):
+                        throttled.append(ops[error['index']])
+                        throttle_msg = error.get('errmsg')
+                    else:
+                        self._results['failed'] = self._results['failed'] + 1
+                        self._errors.append(self.error_entry(
+                            op_index, kind, error.get('code'), error.get('errmsg')))
+                if len(throttled) > 0 and attempt < self._governor.max_retries():
+                    attempt = attempt + 1
+                    self._governor.backoff(attempt, throttle_msg)
+                    ops = throttled
+                else:
+                    for op_index, kind, operation in throttled:
+                        self._results['failed'] = self._results['failed'] + 1
+                        self._errors.append(self.error_entry(op_index, kind, 16500, 'throttled'))
+                    ops = list()
+            except Exception as e:
+                if self._governor != None and self._governor.is_throttled(e) and \
+                        attempt < self._governor.max_retries():
+                    attempt = attempt + 1
+                    self._governor.backoff(attempt, e)
+                else:
+                    for op_index, kind, operation in ops:
+                        self._results['failed'] = self._results['failed'] + 1
+                        self._errors.append(self.error_entry(
+                            op_index, kind, getattr(e, 'code', None), str(e)))
+                    ops = list()
+
+    def add_counts(self, details):
+        self._results['inserted'] += details.get('nInserted', 0)
+        self._results['matched'] += details.get('nMatched', 0)
+        self._results['modified'] += details.get('nModified', 0)
+        self._results['deleted'] += details.get('nRemoved', 0)
+        self._results['upserted'] += details.get('nUpserted', 0)
+
+    def error_entry(self, op_index, kind, code, errmsg):
+        return {'op_index': op_index, 'op': kind, 'code': code, 'errmsg': errmsg}
+
+    def results(self):
+        """ Return the aggregated counts and the list of per-operation errors. """
+        r = dict(self._results)
+        r['ops'] = self._op_count
+        r['pending'] = len(self._ops)
+        r['errors'] = list(self._errors)
+        return r
+
+    def close(self):
+        self.flush()
+        return self.results()
@@ -10,6 +10,11 @@ class Bytes(object):
     def human_readable(cls, n):
         return humanize.intcomma(n) 
 
+    @classmethod
+    def humanized(cls, n):
+        # for example '1.3 MiB'
+        return humanize.naturalsize(n, binary=True)
+
     @classmethod
     def kilobyte(cls):
         return 1024
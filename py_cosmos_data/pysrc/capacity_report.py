@@ -0,0 +1,90 @@
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from pysrc.bytes import Bytes
+from pysrc.fs import FS
+
+# This class is used to produce a capacity planning report of every collection
+# in a MongoDBInstance, from collStats.  The collStats commands are executed
+# concurrently, and the report includes the growth since the previous report.
+# The report is written as both JSON and CSV.
+#
+# Chris Joakim, Microsoft
+
+class CapacityReport(object):
+
+    CSV_FIELDS = [
+        'db', 'coll', 'count', 'count_delta', 'size', 'size_human', 'size_delta',
+        'size_delta_human', 'avg_obj_size', 'avg_obj_size_human', 'storage_size',
+        'storage_size_human', 'total_index_size', 'total_index_size_human',
+        'num_indexes', 'error'
+    ]
+
+    def __init__(self, instance, opts):
+        self._instance = instance
+        self._opts = opts
+        self._workers = max(1, int(opts.get('workers', 8)))
+        self._json_file = opts.get('json_file', 'tmp/capacity_report.json')
+        self._csv_file = opts.get('csv_file', 'tmp/capacity_report.csv')
+
+    def run(self):
+        pairs = list()
+        for db_name, coll_names in sorted(self._instance.collections.items()):
+            for coll_name in sorted(coll_names):
+                pairs.append((db_name, coll_name))
+        print('capacity_report - {} collections, {} workers'.format(len(pairs), self._workers))
+
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            rows = list(executor.map(self.collection_row, pairs))
+
+        previous = self.previous_rows()
+        for row in rows:
+            prev = previous.get('{}|{}'.format(row['db'], row['coll']))
+            row['count_delta'] = (row['count'] - prev['count']) if prev else None
+            row['size_delta'] = (row['size'] - prev['size']) if prev else None
+            if row['size_delta'] != None:
+                sign = '-' if row['size_delta'] < 0 else ''
+                row['size_delta_human'] = sign + Bytes.humanized(abs(row['size_delta']))
+            else:
+                row['size_delta_human'] = None
+
+        report = dict()
+        report['epoch'] = int(time.time())
+        report['collections'] = rows
+        FS.write_json(report, self._json_file)
+        FS.write_json(report, self._json_file.replace('.json', '_{}.json'.format(report['epoch'])))
+        FS.write_csv_objects(rows, self.CSV_FIELDS, self._csv_file)
+        return report
+
+    def collection_row(self, pair):
+        db_name, coll_name = pair
+        row = dict()
+        row['db'], row['coll'] = db_name, coll_name
+        try:
+            stats = self._instance.get_database(db_name).get_collection(coll_name).get_stats()
+            row['count'] = int(stats.get('count', 0))
+            row['size'] = int(stats.get('size', 0))
+            row['avg_obj_size'] = int(stats.get('avgObjSize', 0))
+            row['storage_size'] = int(stats.get('storageSize', 0))
+            row['total_index_size'] = int(stats.get('totalIndexSize', 0))
+            row['index_sizes'] = stats.get('indexSizes', dict())
+            row['num_indexes'] = int(stats.get('nindexes', len(row['index_sizes'])))
+            row['error'] = None
+        except Exception as e:
+            for name in ['count', 'size', 'avg_obj_size', 'storage_size', 'total_index_size', 'num_indexes']:
+                row[name] = 0
+            row['index_sizes'] = dict()
+            row['error'] = str(e)
+        for name in ['size', 'avg_obj_size', 'storage_size', 'total_index_size']:
+            row['{}_human'.format(name)] = Bytes.humanized(row[name])
+        return row
+
+    def previous_rows(self):
+        rows = dict()
+        if os.path.exists(self._json_file):
+            for row in FS.read_json(self._json_file).get('collections', list()):
+                if row.get('error') == None:
+                    rows['{}|{}'.format(row['db'], row['coll'])] = row
+        return rows
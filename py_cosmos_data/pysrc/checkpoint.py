@@ -0,0 +1,56 @@
+import json
+import os
+import threading
+
+# This class is used to record the input offset up to which a load has been
+# committed, so that an interrupted load can be resumed.  Batches may complete
+# out of order with concurrent writers, so the offset only advances over the
+# contiguous sequence of successfully completed batches.
+#
+# Chris Joakim, Microsoft
+
+class Checkpoint(object):
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._next_batch = 1
+        self._completed = dict()  # batch_num -> end_offset, or None if failed
+        self._blocked = False
+
+    def load(self):
+        """ Return the committed offset recorded in the file, or 0. """
+        if os.path.exists(self._filename):
+            with open(self._filename, 'rt') as f:
+                self._offset = int(json.loads(f.read()).get('offset', 0))
+        return self._offset
+
+    def offset(self):
+        return self._offset
+
+    def commit(self, batch_num, end_offset, succeeded=True):
+        with self._lock:
+            self._completed[batch_num] = end_offset if succeeded else None
+            advanced = False
+            while (not self._blocked) and (self._next_batch in self._completed):
+                end = self._completed.pop(self._next_batch)
+                if end == None:
+                    # a failed batch must be reloaded on resume
+                    self._blocked = True
+                else:
+                    self._offset = end
+                    self._next_batch = self._next_batch + 1
+                    advanced = True
+            if advanced:
+                self.write()
+
+    def write(self):
+        tmp = '{}.tmp'.format(self._filename)
+        with open(tmp, 'wt') as f:
+            f.write(json.dumps({'offset': self._offset}))
+        os.replace(tmp, self._filename)
+
+    def delete(self):
+        if os.path.exists(self._filename):
+            os.remove(self._filename)
@@ -0,0 +1,150 @@
+import os
+
+import numpy as np
+
+from pysrc.json_codec import JsonCodec
+
+# This class is used to store a list of JSON documents in a columnar binary
+# format; one NumPy .npy file per (flattened, dotted) field, plus a shared
+# string table and a manifest.json.  Numeric columns are memory-mapped when
+# read, so re-runs of the load and analysis steps don't re-parse JSON text.
+# String fields are dictionary-encoded as int32 codes into the string table;
+# other values, such as lists, are stored in the string table as JSON text.
+# A code of -1 means that the field is absent from the document.
+#
+# Chris Joakim, Microsoft
+
+class ColumnarStore(object):
+
+    MANIFEST = 'manifest.json'
+    STRINGS = 'strings.json'
+    MISSING = -1
+    ABSENT = object()  # marks a field which is absent from a document while writing
+
+    def __init__(self, directory):
+        self._dir = directory
+        self._manifest = JsonCodec.read_file(os.path.join(directory, self.MANIFEST))
+        self._strings = JsonCodec.read_file(os.path.join(directory, self.STRINGS))
+        self._columns = dict()
+        for col in self._manifest['columns']:
+            path = os.path.join(directory, col['file'])
+            self._columns[col['name']] = np.load(path, mmap_mode='r')
+
+    @classmethod
+    def write(cls, docs, directory, verbose=True):
+        """ Write the given list of documents to the directory, return the count. """
+        names, values = list(), dict()
+        for idx, doc in enumerate(docs):
+            for name, value in cls.flatten(doc):
+                if name not in values:
+                    names.append(name)
+                    values[name] = [cls.ABSENT] * idx
+                values[name].append(value)
+            for name in names:
+                if len(values[name]) == idx:
+                    values[name].append(cls.ABSENT)
+        count = len(docs)
+
+        os.makedirs(directory, exist_ok=True)
+        strings, codes = list(), dict()
+        manifest = {'count': count, 'columns': list()}
+        for col_idx, name in enumerate(names):
+            kind, data = cls.encode_column(values[name], strings, codes)
+            filename = 'c{:03d}.npy'.format(col_idx)
+            np.save(os.path.join(directory, filename), data)
+            manifest['columns'].append(
+                {'name': name, 'kind': kind, 'dtype': str(data.dtype), 'file': filename})
+        JsonCodec.write_file(strings, os.path.join(directory, cls.STRINGS), pretty=False)
+        # the manifest is written last, so an incomplete store can't be opened
+        JsonCodec.write_file(manifest, os.path.join(directory, cls.MANIFEST))
+        if verbose == True:
+            print('columnar store written: {} ({} docs, {} columns)'.format(
+                directory, count, len(names)))
+        return count
+
+    @classmethod
+    def flatten(cls, doc, prefix=''):
+        # nested objects become dotted names; lists and scalars are leaf values
+        for key, value in doc.items():
+            name = prefix + key
+            if isinstance(value, dict) and len(value) > 0:
+                for item in cls.flatten(value, name + '.'):
+                    yield item
+            else:
+                yield name, value
+
+    @classmethod
+    def encode_column(cls, values, strings, codes):
+        if all(type(v) == int for v in values):
+            return 'int', np.array(values, dtype=np.int64)
+        if all(type(v) == float for v in values):
+            return 'float', np.array(values, dtype=np.float64)
+        kind = 'str' if all(type(v) == str or v is cls.ABSENT for v in values) else 'json'
+        data = np.empty(len(values), dtype=np.int32)
+        for idx, value in enumerate(values):
+            if value is cls.ABSENT:
+                data[idx] = cls.MISSING
+                continue
+            s = value if kind == 'str' else JsonCodec.dumps(value)
+            code = codes.get(s)
+            if code == None:
+                code = len(strings)
+                codes[s] = code
+                strings.append(s)
+            data[idx] = code
+        return kind, data
+
+    def count(self):
+        return int(self._manifest['count'])
+
+    def column_names(self):
+        return [col['name'] for col in self._manifest['columns']]
+
+    def column(self, name):
+        """ Return the memory-mapped array of the column; string codes for str/json columns. """
+        return self._columns[name]
+
+    def values(self, name):
+        """ Return the decoded values of the column as a list. """
+        kind = self.column_kind(name)
+        data = self._columns[name]
+        if kind in ('int', 'float'):
+            return data.tolist()
+        return [self.decode(kind, code) for code in data.tolist()]
+
+    def column_kind(self, name):
+        for col in self._manifest['columns']:
+            if col['name'] == name:
+                return col['kind']
+        raise KeyError(name)
+
+    def decode(self, kind, code):
+        if code == self.MISSING:
+            return None  # absent
+        if kind == 'str':
+            return self._strings[code]
+        return JsonCodec.loads(self._strings[code])
+
+    def iter_docs(self, chunk_size=10000):
+        """ Return a generator of the reconstructed documents. """
+        columns = list()
+        for col in self._manifest['columns']:
+            path = col['name'].split('.')
+            columns.append((path, col['kind'], self._columns[col['name']]))
+        for start in range(0, self.count(), chunk_size):
+            # convert a slice of each column at a time, rather than indexing per value
+            chunk = [(path, kind, data[start:start + chunk_size].tolist())
+                     for path, kind, data in columns]
+            for idx in range(len(chunk[0][2]) if len(chunk) > 0 else 0):
+                doc = dict()
+                for path, kind, data in chunk:
+                    value = data[idx]
+                    if kind not in ('int', 'float'):
+                        if value == self.MISSING:
+                            continue
+                        value = self.decode(kind, value)
+                    target = doc
+                    for key in path[:-1]:
+                        target = target.setdefault(key, dict())
+                    target[path[-1]] = value
+                yield doc
@@ -0,0 +1,66 @@
+import queue
+import threading
+
+from pysrc.bulk_loader import BulkLoader
+
+# This class is used to load documents into a MongoDB/CosmosDB collection
+# with N worker threads.  Batches are placed on a bounded queue, so reading
+# the input never runs far ahead of the writers, and are written by the
+# workers with the same Mongo object; pymongo's MongoClient is thread-safe
+# and pools its connections.  Progress and errors are aggregated across
+# the workers by the BulkLoader superclass.
+#
+# Chris Joakim, Microsoft
+
+class ConcurrentLoader(BulkLoader):
+
+    def __init__(self, mongo, opts):
+        BulkLoader.__init__(self, mongo, opts)
+        self._workers = max(1, int(opts.get('workers', 4)))
+        queue_size = int(opts.get('queue_size', self._workers * 2))
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = list()
+
+    def start(self):
+        if len(self._threads) > 0:
+            return
+        for n in range(self._workers):
+            t = threading.Thread(target=self.worker, name='loader-{}'.format(n), daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def add(self, doc):
+        self.start()
+        BulkLoader.add(self, doc)
+
+    def flush(self):
+        if len(self._batch) == 0:
+            return
+        batch, self._batch = self._batch, list()
+        self._stats['batches'] = self._stats['batches'] + 1
+        item = (batch, self._stats['batches'], self._offset)
+        self._queue.put(item)  # blocks while the queue is full
+
+    def worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item == None:
+                    return
+                batch, batch_num, end_offset = item
+                self.write_batch(batch, batch_num, end_offset)
+            except Exception as e:
+                print('worker {} - unexpected error: {}'.format(
+                    threading.current_thread().name, str(e)))
+            finally:
+                self._queue.task_done()
+
+    def finish(self):
+        self.flush()
+        for t in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = list()
+        self.log_progress(True)
+        return self.stats()
@@ -0,0 +1,178 @@
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import json_util
+
+from pysrc.fs import FS
+
+# This class is used to export a MongoDB/CosmosDB collection to a JSON lines
+# file, compressed if the filename ends with '.gz' or '.zst'.  The collection is
+# read in pages with range-based pagination on _id, so memory use is bounded
+# by the page size, and the last exported _id is recorded in a state file
+# after each page so that an interrupted export can be resumed.  On resume,
+# documents of a page that was written but not yet recorded may appear twice.
+#
+# Chris Joakim, Microsoft
+
+class CollectionExporter(object):
+
+    def __init__(self, mongo, opts):
+        self._m = mongo
+        self._opts = opts
+        self._outfile = opts['outfile']
+        self._query = opts.get('query', dict())
+        self._page_size = int(opts.get('page_size', 1000))
+        self._cursor_batch_size = opts.get('cursor_batch_size', None)
+        self._projection = self.projection(opts.get('fields', None))
+        self._compress_level = int(opts.get('compress_level', 6))
+        self._progress_interval = int(opts.get('progress_interval', 10000))
+        self._resume = opts.get('resume', False)
+        self._state_file = '{}.state.json'.format(self._outfile)
+        self._label = opts.get('label', 'export')
+        self._json_options = json_util.RELAXED_JSON_OPTIONS
+
+    def projection(self, fields):
+        # the _id is always exported, as it is the pagination key
+        if fields == None or len(fields) == 0:
+            return None
+        projection = dict()
+        for field in fields:
+            if field != '_id':
+                projection[field] = 1
+        return projection
+
+    def run(self):
+        last_id, count, mode = None, 0, 'wt'
+        if self._resume and os.path.exists(self._state_file):
+            state = self.read_state()
+            if state.get('complete', False):
+                print('{} - already complete per {}'.format(self._label, self._state_file))
+                return state
+            last_id, count, mode = state['last_id'], state['count'], 'at'
+            print('{} - resuming after _id {}, {} docs already exported'.format(self._label, last_id, count))
+
+        t1, start_count, last_progress = time.time(), count, count
+        with self.open_output(mode) as f:
+            while True:
+                page = list(self._m.find_page(
+                    self._query, last_id, self._page_size, self._projection, self._cursor_batch_size))
+                if len(page) == 0:
+                    break
+                for doc in page:
+                    f.write(json_util.dumps(doc, json_options=self._json_options))
+                    f.write("\n")
+                last_id, count = page[-1]['_id'], count + len(page)
+                f.flush()
+                self.write_state(last_id, count, False)
+                if (count - last_progress) >= self._progress_interval:
+                    last_progress = count
+                    elapsed = time.time() - t1
+                    print('{} - docs: {}, elapsed: {}, docs/sec: {}'.format(
+                        self._label, count, round(elapsed, 3),
+                        round((count - start_count) / elapsed, 1) if elapsed > 0 else 0.0))
+        state = self.write_state(last_id, count, True)
+        print('{} - complete, {} docs written to {}'.format(self._label, count, self._outfile))
+        return state
+
+    def open_output(self, mode):
+        return FS.open_text(self._outfile, mode, encoding='utf-8', level=self._compress_level)
+
+    def read_state(self):
+        with open(self._state_file, 'rt') as f:
+            return json_util.loads(f.read())
+
+    def write_state(self, last_id, count, complete):
+        state = dict()
+        state['outfile'] = self._outfile
+        state['last_id'] = last_id
+        state['count'] = count
+        state['complete'] = complete
+        tmp = '{}.tmp'.format(self._state_file)
+        with open(tmp, 'wt') as f:
+            f.write(json_util.dumps(state, json_options=self._json_options))
+        os.replace(tmp, self._state_file)
+        return state
+
+
+# This class is used to export a collection with N concurrent readers.  The
+# collection is divided into ranges of the _id, or another field such as the
+# partition key, by sampling split points; each range is exported by a
+# CollectionExporter to its own shard file, and a manifest lists the shards.
+# The split points are kept in the manifest, so a resumed export re-uses them.
+# The first range also includes the documents without the split field, or
+# with a value of another BSON type than the split points; see range_filters.
+#
+# Chris Joakim, Microsoft
+
+class ParallelCollectionExporter(object):
+
+    def __init__(self, mongo, opts):
+        self._m = mongo
+        self._opts = opts
+        self._outfile = opts['outfile']
+        self._workers = max(1, int(opts.get('workers', 4)))
+        self._split_field = opts.get('split_field', '_id')
+        self._sample_size = int(opts.get('sample_size', 1000))
+        self._resume = opts.get('resume', False)
+        self._manifest_file = '{}.manifest.json'.format(self.base_and_ext()[0])
+
+    def run(self):
+        split_points = None
+        if self._resume and os.path.exists(self._manifest_file):
+            with open(self._manifest_file, 'rt') as f:
+                manifest = json_util.loads(f.read())
+            split_points = manifest['split_points']
+            print('export - resuming with the split points in {}'.format(self._manifest_file))
+        if split_points == None:
+            split_points = self._m.sample_split_points(
+                self._split_field, self._workers, self._sample_size)
+        filters = self._m.range_filters(self._split_field, split_points)
+        self.write_manifest(split_points, filters, None)
+        print('export - {} workers, {} {} ranges'.format(self._workers, len(filters), self._split_field))
+
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            states = list(executor.map(self.export_range, enumerate(filters)))
+        return self.write_manifest(split_points, filters, states)
+
+    def export_range(self, idx_and_filter):
+        idx, query_spec = idx_and_filter
+        opts = dict(self._opts)
+        opts['outfile'] = self.shard_file(idx)
+        opts['query'] = query_spec
+        opts['label'] = 'export part {}'.format(idx)
+        return CollectionExporter(self._m, opts).run()
+
+    def base_and_ext(self):
+        # tmp/routes.jsonl.gz -> ('tmp/routes', '.jsonl.gz')
+        if '.jsonl' in self._outfile:
+            idx = self._outfile.rindex('.jsonl')
+            return self._outfile[:idx], self._outfile[idx:]
+        return os.path.splitext(self._outfile)
+
+    def shard_file(self, idx):
+        base, ext = self.base_and_ext()
+        return '{}.part-{:03d}{}'.format(base, idx, ext)
+
+    def write_manifest(self, split_points, filters, states):
+        manifest = dict()
+        manifest['outfile'] = self._outfile
+        manifest['split_field'] = self._split_field
+        manifest['split_points'] = split_points
+        manifest['shards'] = list()
+        for idx, query_spec in enumerate(filters):
+            shard = dict()
+            shard['file'] = self.shard_file(idx)
+            shard['query'] = query_spec
+            if states != None:
+                shard['count'] = states[idx]['count']
+                shard['complete'] = states[idx]['complete']
+            manifest['shards'].append(shard)
+        if states != None:
+            manifest['count'] = sum([state['count'] for state in states])
+            manifest['complete'] = all([state['complete'] for state in states])
+        with open(self._manifest_file, 'wt') as f:
+            f.write(json_util.dumps(manifest, json_options=json_util.RELAXED_JSON_OPTIONS, indent=2))
+        print('file written: {}'.format(self._manifest_file))
+        return manifest
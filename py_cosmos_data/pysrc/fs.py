@@ -1,13 +1,77 @@
 import csv
+import gzip
+import io
 import json
+import mmap
 import os
 
+from pysrc.json_codec import JsonCodec
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # This class is used to do IO operations vs the local File System.
+# Files with a '.gz' or '.zst' extension are transparently compressed and
+# decompressed as streams; see open_text and open_binary.
 #
 # Chris Joakim, Microsoft
 
 class FS(object):
 
+    COMPRESSED_EXTENSIONS = ['.gz', '.zst']
+
+    compress_level = None  # None -> the default level of the compression library
+
+    @classmethod
+    def set_compress_level(cls, level):
+        cls.compress_level = level
+
+    @classmethod
+    def compression(cls, filename):
+        # return 'gz', 'zst' or None per the extension of the filename
+        for ext in cls.COMPRESSED_EXTENSIONS:
+            if str(filename).lower().endswith(ext):
+                return ext[1:]
+        return None
+
+    @classmethod
+    def existing_variant(cls, filename):
+        # return the filename, or its first compressed variant which exists
+        for name in [filename] + [filename + ext for ext in cls.COMPRESSED_EXTENSIONS]:
+            if os.path.exists(name):
+                return name
+        return filename
+
+    @classmethod
+    def open_binary(cls, filename, mode='rb', level=None):
+        mode = mode if 'b' in mode else mode + 'b'
+        level = level if level != None else cls.compress_level
+        compression = cls.compression(filename)
+        if compression == 'gz':
+            if 'r' in mode:
+                return gzip.open(filename, mode)
+            return gzip.open(filename, mode, compresslevel=(level if level != None else 6))
+        if compression == 'zst':
+            if zstandard == None:
+                raise ValueError('the zstandard library is required for {}'.format(filename))
+            if 'r' in mode:
+                # appended files, such as resumed exports, contain several frames
+                return zstandard.ZstdDecompressor().stream_reader(
+                    open(filename, 'rb'), read_across_frames=True, closefd=True)
+            compressor = zstandard.ZstdCompressor(level=(level if level != None else 3))
+            return compressor.stream_writer(open(filename, mode), closefd=True)
+        return open(filename, mode)
+
+    @classmethod
+    def open_text(cls, filename, mode='rt', encoding=None, newline=None, level=None):
+        mode = mode.replace('t', '').replace('b', '')
+        if cls.compression(filename) == None:
+            return open(filename, mode + 't', encoding=encoding, newline=newline)
+        stream = cls.open_binary(filename, mode + 'b', level)
+        return io.TextIOWrapper(stream, encoding=encoding, newline=newline)
+
     @classmethod
     def as_unix_filename(cls, filename):
         if filename.upper().startswith("C:"):
@@ -21,27 +85,41 @@ class FS(object):
 
     @classmethod
     def read(cls, infile):
-        with open(infile, 'rt') as f:
+        with cls.open_text(infile, 'rt') as f:
             return f.read()
 
     @classmethod
     def readt(cls, infile):
-        with open(infile, 'r') as f:
+        with cls.open_text(infile, 'r') as f:
             return f.read()
 
     @classmethod
     def read_binary(cls, infile):
-        with open(infile, 'rb') as f:
+        with cls.open_binary(infile, 'rb') as f:
             return f.read()
 
     @classmethod
     def read_lines(cls, infile):
         lines = list()
-        with open(infile, 'rt') as f:
+        with cls.open_text(infile, 'rt') as f:
             for line in f:
                 lines.append(line)
         return lines
 
+    @classmethod
+    def iter_lines(cls, infile, encoding='utf-8', use_mmap=False):
+        # return a generator of the lines, with their line endings, as in read_lines;
+        # with use_mmap an uncompressed file is read via a read-only memory map
+        if use_mmap and cls.compression(infile) == None and os.path.getsize(infile) > 0:
+            with open(infile, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for line in iter(mm.readline, b''):
+                        yield line.decode(encoding).replace('\r\n', '\n')
+        else:
+            with cls.open_text(infile, 'rt', encoding=encoding) as f:
+                for line in f:
+                    yield line
+
     @classmethod
     def read_single_line(cls, infile):
         return cls.read_lines(infile)[0].strip()
@@ -49,26 +127,26 @@ class FS(object):
     @classmethod
     def read_encoded_lines(cls, infile, encoding='cp1252'):
         lines = list()
-        with open(infile, 'rt', encoding=encoding) as f:
+        with cls.open_text(infile, 'rt', encoding=encoding) as f:
             for line in f:
                 lines.append(line)
         return lines
 
     @classmethod
     def read_win_cp1252(cls, infile, encoding='cp1252'):
-        with open(os.path.join(infile), 'r', encoding='cp1252') as f:
+        with cls.open_text(os.path.join(infile), 'r', encoding='cp1252') as f:
             return f.read()
 
     @classmethod
     def read_csv(cls, infile, reader='default', delim=',', dialect='excel', skip=0):
         rows = list()
         if reader == 'dict':
-            with open(infile, 'rt') as csvfile:
+            with cls.open_text(infile, 'rt') as csvfile:
                 rdr = csv.DictReader(csvfile, dialect=dialect, delimiter=delim)
                 for row in rdr:
                     rows.append(row)
         else:
-            with open(infile) as csvfile:
+            with cls.open_text(infile) as csvfile:
                 rdr = csv.reader(csvfile, delimiter=delim)
                 for idx, row in enumerate(rdr):
                     if idx >= skip:
@@ -77,30 +155,109 @@ class FS(object):
 
     @classmethod
     def read_json(cls, infile):
-        with open(infile, 'rt') as f:
-            return json.loads(f.read())
+        with cls.open_binary(infile, 'rb') as f:
+            return JsonCodec.loads(f.read())
+
+    @classmethod
+    def iter_jsonl(cls, infile, use_mmap=False):
+        # return a generator of the documents in a JSON-lines file
+        for line in cls.iter_lines(infile, use_mmap=use_mmap):
+            line = line.strip()
+            if len(line) > 0:
+                yield JsonCodec.loads(line)
+
+    @classmethod
+    def iter_json_values(cls, infile, chunk_size=65536):
+        # incrementally parse a file containing a top-level JSON array or object,
+        # yielding the array elements or the object values one at a time
+        decoder = json.JSONDecoder()
+        with cls.open_text(infile, 'rt', encoding="utf-8") as f:
+            buf, pos, eof = '', 0, False
+            container = None
+            while True:
+                # skip whitespace and separators, reading more text as needed
+                while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                    pos = pos + 1
+                if pos >= len(buf):
+                    if eof:
+                        return
+                    chunk = f.read(chunk_size)
+                    eof = len(chunk) == 0
+                    buf, pos = buf[pos:] + chunk, 0
+                    continue
+                c = buf[pos]
+                if container == None:
+                    if c not in '[{':
+                        raise ValueError('expected a JSON array or object in {}'.format(infile))
+                    container, pos = c, pos + 1
+                    continue
+                if c in ']}':
+                    return
+                try:
+                    start = pos
+                    if container == '{':
+                        key, pos = decoder.raw_decode(buf, pos)
+                        pos = buf.index(':', pos) + 1
+                        while pos < len(buf) and buf[pos] in ' \t\r\n':
+                            pos = pos + 1
+                    value, end = decoder.raw_decode(buf, pos)
+                    if not eof and (end >= len(buf) or (cls.is_json_number(value) and
+                            buf[end] in '.eE+-0123456789')):
+                        # a number such as 1.5e10 may be cut at the end of the buffer
+                        raise ValueError('value may continue in the next chunk')
+                except ValueError:
+                    if eof:
+                        raise
+                    chunk = f.read(chunk_size)
+                    eof = len(chunk) == 0
+                    buf, pos = buf[start:] + chunk, 0
+                    continue
+                pos = end
+                yield value
+
+    @classmethod
+    def is_json_number(cls, value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
 
     @classmethod
     def read_json_utf8(cls, infile):
-        with open(infile, 'r', encoding="utf-8") as f:
-            return json.loads(f.read())
+        return cls.read_json(infile)
 
     @classmethod
-    def write_json(cls, obj, outfile, pretty=True, verbose=True):
-        jstr = None
-        if pretty == True:
-            jstr = json.dumps(obj, sort_keys=False, indent=2)
-        else:
-            jstr = json.dumps(obj)
+    def write_json(cls, obj, outfile, pretty=True, verbose=True, level=None):
+        jstr = JsonCodec.dumps(obj, pretty=(pretty == True))
 
-        with open(outfile, 'w') as f:
+        with cls.open_text(outfile, 'w', encoding="utf-8", level=level) as f:
             f.write(jstr)
             if verbose == True:
                 print('file written: {}'.format(outfile))
 
+    @classmethod
+    def write_jsonl(cls, objects, outfile, verbose=True, level=None):
+        # stream the given iterable as compact JSON, one document per line
+        count = 0
+        with cls.open_text(outfile, 'w', encoding="utf-8", level=level) as f:
+            for obj in objects:
+                f.write(JsonCodec.dumps(obj))
+                f.write("\n")
+                count = count + 1
+            if verbose == True:
+                print('file written: {}'.format(outfile))
+        return count
+
+    @classmethod
+    def write_csv_objects(cls, objects, fieldnames, outfile, verbose=True):
+        with cls.open_text(outfile, 'w', encoding="utf-8", newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            for obj in objects:
+                writer.writerow(obj)
+            if verbose == True:
+                print('file written: {}'.format(outfile))
+
     @classmethod
     def write_lines(cls, lines, outfile, verbose=True):
-        with open(outfile, 'w', encoding="utf-8") as f:
+        with cls.open_text(outfile, 'w', encoding="utf-8") as f:
             #f.writelines(lines)
             for line in lines:
                 f.write(line + "\n") # os.linesep)  # \n works on Windows
@@ -110,13 +267,43 @@ class FS(object):
     @classmethod
     def text_file_iterator(cls, infile):
         # return a line generator that can be iterated with iterate()
-        with open(infile, 'rt') as f:
+        with cls.open_text(infile, 'rt') as f:
             for line in f:
                 yield line.strip()
 
+    @classmethod
+    def line_aligned_ranges(cls, infile, count):
+        # split the file into up to count (start, end) byte ranges which begin
+        # and end on line boundaries, for parallel processing
+        size = os.path.getsize(infile)
+        bounds = [0]
+        with open(infile, 'rb') as f:
+            for idx in range(1, count):
+                pos = max(bounds[-1], (size * idx) // count)
+                if pos > 0:
+                    f.seek(pos - 1)
+                    f.readline()  # advance to the start of the next line
+                    pos = f.tell()
+                bounds.append(min(pos, size))
+        bounds.append(size)
+        return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+    @classmethod
+    def iter_lines_in_range(cls, infile, start, end, encoding='utf-8'):
+        # return a generator of the stripped lines within a range of line_aligned_ranges
+        with open(infile, 'rb') as f:
+            f.seek(start)
+            pos = start
+            while pos < end:
+                line = f.readline()
+                if len(line) == 0:
+                    return
+                pos = pos + len(line)
+                yield line.decode(encoding).strip()
+
     @classmethod
     def write(cls, outfile, s, verbose=True):
-        with open(outfile, 'w') as f:
+        with cls.open_text(outfile, 'w') as f:
             f.write(s)
             if verbose == True:
                 print('file written: {}'.format(outfile))
@@ -143,22 +330,51 @@ class FS(object):
 
     @classmethod
     def walk(cls, directory):
-        files = list()
-        for dir_name, subdirs, base_names in os.walk(directory):
-            for base_name in base_names:
-                full_name = "{}/{}".format(dir_name, base_name)
-                entry = dict()
-                entry['base'] = base_name
-                entry['dir'] = dir_name
-                entry['full'] = full_name
-                entry['abspath'] = os.path.abspath(full_name)
-                files.append(entry)
-        return files
+        return list(cls.iter_walk(directory))
+
+    @classmethod
+    def iter_walk(cls, directory):
+        # return a generator of the walk entry dicts, lazily
+        abs_dirs = dict()  # os.path.abspath is called once per directory, not per file
+        for dir_name, dir_entry in cls.scandir_walk(directory):
+            if dir_name not in abs_dirs:
+                abs_dirs[dir_name] = os.path.abspath(dir_name)
+            entry = dict()
+            entry['base'] = dir_entry.name
+            entry['dir'] = dir_name
+            entry['full'] = "{}/{}".format(dir_name, dir_entry.name)
+            entry['abspath'] = os.path.join(abs_dirs[dir_name], dir_entry.name)
+            yield entry
+
+    @classmethod
+    def scandir_walk(cls, directory, follow_symlinks=False):
+        # return a generator of (dir_name, os.DirEntry) tuples for the files in the
+        # directory tree, top-down in the same order as os.walk.  The DirEntry
+        # objects cache their stat() results, so sizes and times are cheap to get.
+        pending = [directory]
+        while len(pending) > 0:
+            dir_name = pending.pop()
+            subdirs = list()
+            try:
+                with os.scandir(dir_name) as entries:
+                    for dir_entry in entries:
+                        try:
+                            is_dir = dir_entry.is_dir()
+                        except OSError:
+                            is_dir = False
+                        if is_dir:
+                            if follow_symlinks or not dir_entry.is_symlink():
+                                subdirs.append(os.path.join(dir_name, dir_entry.name))
+                        else:
+                            yield dir_name, dir_entry
+            except OSError:
+                continue  # unreadable directories are skipped, as in os.walk
+            pending.extend(reversed(subdirs))
 
     @classmethod
     def read_csvfile_into_rows(cls, infile, delim=','):
         rows = list()  # return a list of csv rows
-        with open(infile, 'rt') as csvfile:
+        with cls.open_text(infile, 'rt') as csvfile:
             reader = csv.reader(csvfile, delimiter=delim)
             for row in reader:
                 rows.append(row)
@@ -167,7 +383,7 @@ class FS(object):
     @classmethod
     def read_csvfile_into_objects(cls, infile, delim=','):
         objects = list()  # return a list of dicts
-        with open(infile) as csvfile:
+        with cls.open_text(infile) as csvfile:
             reader = csv.reader(csvfile, delimiter=delim)
             headers = None
             for idx, row in enumerate(reader):
@@ -181,3 +397,23 @@ class FS(object):
                             obj[key] = row[field_idx].strip()
                         objects.append(obj)
         return objects
+
+    @classmethod
+    def iter_csv_rows(cls, infile, delim=',', encoding='utf-8'):
+        # return a generator of the csv rows
+        with cls.open_text(infile, 'rt', encoding=encoding, newline='') as csvfile:
+            for row in csv.reader(csvfile, delimiter=delim):
+                yield row
+
+    @classmethod
+    def iter_csv_objects(cls, infile, delim=',', encoding='utf-8'):
+        # return a generator of dicts, as in read_csvfile_into_objects
+        headers = None
+        for row in cls.iter_csv_rows(infile, delim, encoding):
+            if headers == None:
+                headers = [field_name.strip().lower() for field_name in row]
+            elif len(row) == len(headers):
+                obj = dict()
+                for field_idx, key in enumerate(headers):
+                    obj[key] = row[field_idx].strip()
+                yield obj
@@ -0,0 +1,32 @@
+import numpy as np
+
+# This class is used to calculate great-circle distances and initial bearings
+# for arrays of coordinates in one vectorized NumPy pass, rather than with
+# per-route Python math.
+#
+# Chris Joakim, Microsoft
+
+class Geo(object):
+
+    EARTH_RADIUS_KM = 6371.0088  # mean earth radius
+
+    @classmethod
+    def haversine_km(cls, lat1, lon1, lat2, lon2):
+        """ Return an array of the distances in km between the given degree arrays. """
+        lat1, lon1, lat2, lon2 = cls.radians(lat1, lon1, lat2, lon2)
+        a = np.sin((lat2 - lat1) / 2.0) ** 2 + \
+            np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+        return 2.0 * cls.EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    @classmethod
+    def initial_bearing(cls, lat1, lon1, lat2, lon2):
+        """ Return an array of the initial compass bearings, 0 to 360 degrees. """
+        lat1, lon1, lat2, lon2 = cls.radians(lat1, lon1, lat2, lon2)
+        dlon = lon2 - lon1
+        x = np.sin(dlon) * np.cos(lat2)
+        y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+        return (np.degrees(np.arctan2(x, y)) + 360.0) % 360.0
+
+    @classmethod
+    def radians(cls, *arrays):
+        return [np.radians(np.asarray(a, dtype=np.float64)) for a in arrays]
@@ -0,0 +1,81 @@
+import json
+import os
+
+# This class is used to encode and decode JSON with the fastest library which
+# is installed; orjson, then ujson, then the standard library json module.
+# Set the JSON_CODEC environment variable to 'orjson', 'ujson' or 'json' to
+# choose a specific library.  Values which a fast library can't handle, such
+# as non-string dict keys, are retried with the standard library.
+#
+# Chris Joakim, Microsoft
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JsonCodec(object):
+
+    BACKENDS = ['orjson', 'ujson', 'json']
+
+    _backend = None
+
+    @classmethod
+    def backend(cls):
+        if cls._backend == None:
+            available = {'orjson': orjson != None, 'ujson': ujson != None, 'json': True}
+            preferred = os.environ.get('JSON_CODEC', '').strip().lower()
+            if available.get(preferred, False):
+                cls._backend = preferred
+            else:
+                cls._backend = [name for name in cls.BACKENDS if available[name]][0]
+        return cls._backend
+
+    @classmethod
+    def loads(cls, s):
+        """ Decode the given str or bytes. """
+        backend = cls.backend()
+        if backend == 'orjson':
+            return orjson.loads(s)
+        if isinstance(s, bytes):
+            s = s.decode('utf-8')
+        if backend == 'ujson':
+            return ujson.loads(s)
+        return json.loads(s)
+
+    @classmethod
+    def dumps(cls, obj, pretty=False, sort_keys=False):
+        """ Encode the obj as a str; compact by default, or indented by 2 if pretty. """
+        backend = cls.backend()
+        try:
+            if backend == 'orjson':
+                option = 0
+                if pretty:
+                    option = option | orjson.OPT_INDENT_2
+                if sort_keys:
+                    option = option | orjson.OPT_SORT_KEYS
+                return orjson.dumps(obj, option=option).decode('utf-8')
+            if backend == 'ujson':
+                return ujson.dumps(obj, indent=(2 if pretty else 0), sort_keys=sort_keys,
+                    ensure_ascii=False, escape_forward_slashes=False)
+        except (TypeError, ValueError, OverflowError):
+            pass  # fall back to the standard library
+        if pretty:
+            return json.dumps(obj, sort_keys=sort_keys, indent=2)
+        return json.dumps(obj, sort_keys=sort_keys, separators=(',', ':'))
+
+    @classmethod
+    def read_file(cls, infile):
+        with open(infile, 'rb') as f:
+            return cls.loads(f.read())
+
+    @classmethod
+    def write_file(cls, obj, outfile, pretty=True):
+        with open(outfile, 'w', encoding='utf-8') as f:
+            f.write(cls.dumps(obj, pretty=pretty))
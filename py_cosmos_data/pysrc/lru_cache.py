@@ -0,0 +1,72 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+# This class is a thread-safe, size-bounded LRU cache with a time-to-live
+# per entry.  The TTL can be set per namespace, such as per collection.
+# It is used by the Mongo class as an optional read-through cache for point
+# lookups of slow-changing reference data; see the 'cache' key of the Mongo opts.
+#
+# Chris Joakim, Microsoft
+
+class LruTtlCache(object):
+
+    def __init__(self, opts=None):
+        opts = opts or dict()
+        self._max_size = int(opts.get('max_size', 10000))
+        self._default_ttl = float(opts.get('default_ttl', 300))
+        self._ttls = dict(opts.get('ttls', dict()))  # namespace -> ttl seconds
+        self._entries = OrderedDict()  # (namespace, key) -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0, 'invalidated': 0}
+
+    def get(self, namespace, key):
+        """ Return a tuple of (found, value). """
+        k = (namespace, key)
+        with self._lock:
+            entry = self._entries.get(k)
+            if entry == None:
+                self._stats['misses'] = self._stats['misses'] + 1
+                return False, None
+            if entry[0] < time.time():
+                del self._entries[k]
+                self._stats['expired'] = self._stats['expired'] + 1
+                self._stats['misses'] = self._stats['misses'] + 1
+                return False, None
+            self._entries.move_to_end(k)
+            self._stats['hits'] = self._stats['hits'] + 1
+            return True, entry[1]
+
+    def put(self, namespace, key, value):
+        ttl = self._ttls.get(namespace, self._default_ttl)
+        if ttl <= 0:
+            return
+        k = (namespace, key)
+        with self._lock:
+            self._entries[k] = (time.time() + ttl, value)
+            self._entries.move_to_end(k)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._stats['evicted'] = self._stats['evicted'] + 1
+
+    def invalidate(self, namespace=None):
+        """ Remove the entries of the given namespace, or all entries. """
+        with self._lock:
+            if namespace == None:
+                count = len(self._entries)
+                self._entries.clear()
+            else:
+                keys = [k for k in self._entries.keys() if k[0] == namespace]
+                for k in keys:
+                    del self._entries[k]
+                count = len(keys)
+            self._stats['invalidated'] = self._stats['invalidated'] + count
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['size'] = len(self._entries)
+        lookups = s['hits'] + s['misses']
+        s['hit_ratio'] = round(float(s['hits']) / lookups, 4) if lookups > 0 else 0.0
+        return s
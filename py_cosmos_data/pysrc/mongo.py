@@ -1,37 +1,184 @@
 import certifi
+import copy
 import json
 import sys
+import threading
+import time
 import traceback
 
+from concurrent.futures import ThreadPoolExecutor
+
 from pymongo import MongoClient
+from bson import json_util
 from bson.objectid import ObjectId
 
+from pysrc.bulk_writer import MongoBulkWriter
+
+# This class is a process-wide registry of MongoClient objects, keyed by
+# connection string and client options.  MongoClient is thread-safe and
+# maintains its own connection pool, so it should be created once per
+# process and shared, rather than once per Mongo or MongoDBInstance object;
+# this avoids repeated TLS handshakes and duplicate connection pools.
+#
+# Chris Joakim, Microsoft
+
+class MongoClientRegistry(object):
+
+    _clients = dict()
+    _lock = threading.Lock()
+
+    # Mongo opts keys -> MongoClient keyword args
+    CLIENT_OPTIONS = {
+        'pool_size': 'maxPoolSize',
+        'min_pool_size': 'minPoolSize',
+        'max_idle_time_ms': 'maxIdleTimeMS',
+        'connect_timeout_ms': 'connectTimeoutMS',
+        'socket_timeout_ms': 'socketTimeoutMS',
+        'server_selection_timeout_ms': 'serverSelectionTimeoutMS',
+        'retry_writes': 'retryWrites',
+        'compressors': 'compressors'
+    }
+
+    @classmethod
+    def client_kwargs(cls, conn_string, opts):
+        kwargs, opts = dict(), opts or dict()
+        if not cls.is_local(conn_string):
+            kwargs['tlsCAFile'] = certifi.where()
+        for opt_name, kwarg_name in cls.CLIENT_OPTIONS.items():
+            if opts.get(opt_name, None) != None:
+                kwargs[kwarg_name] = opts[opt_name]
+        return kwargs
+
+    @classmethod
+    def get(cls, conn_string, opts=None):
+        kwargs = cls.client_kwargs(conn_string, opts)
+        key = '{}|{}'.format(conn_string, sorted(kwargs.items()))
+        with cls._lock:
+            if key not in cls._clients:
+                cls._clients[key] = MongoClient(conn_string, **kwargs)
+            return cls._clients[key]
+
+    @classmethod
+    def is_local(cls, conn_string):
+        # a local mongod, such as for benchmarks, typically doesn't use TLS
+        for host in ['mongodb://localhost', 'mongodb://127.0.0.1']:
+            if conn_string.startswith(host):
+                return True
+        return False
+
+    @classmethod
+    def close_all(cls):
+        with cls._lock:
+            for client in cls._clients.values():
+                client.close()
+            cls._clients = dict()
+
+
 # This class is used to access a MongoDB database, including the CosmosDB Mongo API.
 #
 # Chris Joakim, Microsoft, 2023
 
 class Mongo(object):
 
+    # the operations timed when a MongoMetrics object is given as opts['metrics']
+    INSTRUMENTED_METHODS = [
+        'insert_doc', 'insert_many', 'bulk_write', 'find_one', 'find', 'find_ids', 'find_page',
+        'find_by_id', 'delete_by_id', 'delete_by_ids', 'delete_one', 'delete_many',
+        'update_one', 'update_many', 'count_docs', 'estimated_count'
+    ]
+
+    # the operations which invalidate the cached lookups of the collection, see opts['cache']
+    WRITE_METHODS = [
+        'insert_doc', 'insert_many', 'bulk_write', 'delete_by_id', 'delete_by_ids',
+        'delete_one', 'delete_many', 'update_one', 'update_many'
+    ]
+
     def __init__(self, opts):
         self._opts = opts
         self._db = None
         self._coll = None
         if 'conn_string' in self._opts.keys():
-            if 'cosmos.azure.com' in opts['conn_string']:
-                self._env = 'cosmos'
-            else:
-                self._env = 'mongo'
-            self._client = MongoClient(opts['conn_string'], tlsCAFile=certifi.where())
+            conn_string = opts['conn_string']
+        else:
+            conn_string = 'mongodb://{}:{}'.format(opts['host'], opts['port'])
+        if 'cosmos.azure.com' in conn_string:
+            self._env = 'cosmos'
         else:
-            if 'cosmos.azure.com' in opts['host']:
-                self._env = 'cosmos'
-            else:
-                self._env = 'mongo'
-            self._client = MongoClient(opts['host'], opts['port'], tlsCAFile=certifi.where())
+            self._env = 'mongo'
+        self._client = MongoClientRegistry.get(conn_string, opts)
+
+        self._cache = opts.get('cache', None)  # optional LruTtlCache
+        if self._cache != None:
+            for name in self.WRITE_METHODS:
+                setattr(self, name, self.invalidating_method(getattr(self, name)))
+
+        self._metrics = opts.get('metrics', None)
+        if self._metrics != None:
+            self.instrument()
 
         if self.is_verbose():
             print(json.dumps(self._opts, sort_keys=False, indent=2))
 
+    def instrument(self):
+        # replace the CRUD methods of this instance with timed wrappers
+        for name in self.INSTRUMENTED_METHODS:
+            setattr(self, name, self.timed_method(name, getattr(self, name)))
+
+    def timed_method(self, op, method):
+        # note that find() returns a lazy cursor, so only its creation is timed
+        def timed(*args, **kwargs):
+            coll = self._coll.name if self._coll is not None else None
+            t1 = time.perf_counter()
+            error = None
+            try:
+                return method(*args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                ms = (time.perf_counter() - t1) * 1000.0
+                self._metrics.record(op, coll, ms, error)
+                if error == None and self.is_cosmos() and self._metrics.should_sample_charge():
+                    self.sample_request_charge(op, coll)
+        return timed
+
+    def invalidating_method(self, method):
+        def invalidating(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._cache.invalidate(self.cache_namespace())
+        return invalidating
+
+    def cache_namespace(self):
+        return '{}.{}'.format(self._db.name, self._coll.name)
+
+    def cached_find_one(self, query_spec):
+        # read-through; the cached documents are copied so that callers can't modify them
+        namespace = self.cache_namespace()
+        key = json_util.dumps(query_spec, sort_keys=True)
+        found, doc = self._cache.get(namespace, key)
+        if not found:
+            doc = self._coll.find_one(query_spec)
+            self._cache.put(namespace, key, doc)
+        return copy.deepcopy(doc)
+
+    def cache_stats(self):
+        if self._cache == None:
+            return None
+        return self._cache.stats()
+
+    def sample_request_charge(self, op, coll):
+        # getLastRequestStatistics is per-connection, so with concurrent
+        # threads a sample may occasionally reflect another operation
+        try:
+            self._metrics.record_charge(op, coll, float(self.last_request_request_charge()))
+        except Exception as e:
+            pass
+
+    def is_cosmos(self):
+        return self._env == 'cosmos'
+
     def is_verbose(self):
         if 'verbose' in self._opts.keys():
             return self._opts['verbose']
@@ -60,6 +207,23 @@ class Mongo(object):
             print('Exception - {} connection - {}'.format(self._env, str(e)))
             return None
 
+    def drop_coll(self, collname):
+        return self._db.drop_collection(collname)
+
+    def get_cosmos_coll_metadata(self, collname):
+        # CosmosDB-specific; returns the shard key and throughput settings
+        return self._db.command({'customAction': 'GetCollection', 'collection': collname})
+
+    def create_cosmos_coll(self, collname, shard_key=None, throughput=None, autoscale_max=None):
+        cmd = {'customAction': 'CreateCollection', 'collection': collname}
+        if shard_key != None:
+            cmd['shardKey'] = shard_key
+        if autoscale_max != None:
+            cmd['autoScaleSettings'] = {'maxThroughput': autoscale_max}
+        elif throughput != None:
+            cmd['offerThroughput'] = throughput
+        return self._db.command(cmd)
+
     def get_coll_indexes(self, collname):
         try:
             self.set_coll(collname)
@@ -78,23 +242,57 @@ class Mongo(object):
     def insert_doc(self, doc):
         return self._coll.insert_one(doc)
 
+    def insert_many(self, docs, ordered=False):
+        return self._coll.insert_many(docs, ordered=ordered)
+
+    def bulk_write(self, operations, ordered=False):
+        return self._coll.bulk_write(operations, ordered=ordered)
+
     def find_one(self, query_spec):
+        if self._cache != None:
+            return self.cached_find_one(query_spec)
         return self._coll.find_one(query_spec)
 
     def find(self, query_spec, limit):
         return self._coll.find(query_spec).limit(limit)
 
+    def find_ids(self, query_spec, limit):
+        return [doc['_id'] for doc in self._coll.find(query_spec, {'_id': 1}).limit(limit)]
+
+    def find_page(self, query_spec, after_id, limit, projection=None, batch_size=None):
+        # range-based pagination on _id, rather than skip(), for paged reads of a collection
+        spec = query_spec
+        if after_id != None:
+            range_spec = {'_id': {'$gt': after_id}}
+            spec = {'$and': [query_spec, range_spec]} if len(query_spec) > 0 else range_spec
+        cursor = self._coll.find(spec, projection).sort('_id', 1).limit(limit)
+        if batch_size != None:
+            cursor = cursor.batch_size(batch_size)
+        return cursor
+
     def find_by_id(self, id):
+        if self._cache != None:
+            return self.cached_find_one({'_id': ObjectId(id)})
         return self._coll.find_one({'_id': ObjectId(id)})
 
     def delete_by_id(self, id):
         return self._coll.delete_one({'_id': ObjectId(id)})
 
+    def delete_by_ids(self, ids):
+        return self._coll.delete_many({'_id': {'$in': ids}})
+
     def delete_one(self, query_spec):
         return self._coll.delete_one(query_spec)
 
-    def delete_many(self, query_spec, limit):
-        return self._coll.delete_many(query_spec).limit(limit)
+    def delete_many(self, query_spec, limit=None):
+        # delete_many has no limit; with a limit, delete the _ids of the first limit matches
+        if limit == None:
+            return self._coll.delete_many(query_spec)
+        return self.delete_by_ids(self.find_ids(query_spec, limit))
+
+    def bulk_writer(self, opts=None):
+        """ Return a MongoBulkWriter for mixed, auto-flushed bulk operations on the current collection. """
+        return MongoBulkWriter(self, opts)
 
     def update_one(self, filter, update, upsert):
         # 'update only works with $ operators'
@@ -104,9 +302,55 @@ class Mongo(object):
         # 'update only works with $ operators'
         return self._coll.update_many(filter, update, upsert)
 
+    def watch(self, pipeline=None, resume_after=None, full_document='updateLookup'):
+        # returns a change stream for the current collection
+        return self._coll.watch(pipeline, full_document=full_document, resume_after=resume_after)
+
     def count_docs(self, query_spec):
         return self._coll.count_documents(query_spec)
 
+    def estimated_count(self):
+        # uses collection metadata rather than scanning the collection
+        return self._coll.estimated_document_count()
+
+    def sample_split_points(self, field, num_ranges, sample_size=1000):
+        # return up to num_ranges - 1 sorted values of the field, sampled with $sample,
+        # which divide the collection into num_ranges roughly equal ranges
+        pipeline = [{'$sample': {'size': sample_size}}, {'$project': {field: 1}}]
+        values = [doc[field] for doc in self._coll.aggregate(pipeline) if doc.get(field) != None]
+        if len(values) > 0:
+            # split on the most common type; values of other types are not comparable
+            types = [type(v) for v in values]
+            common = max(set(types), key=types.count)
+            values = sorted(set(v for v in values if type(v) == common))
+        if num_ranges < 2 or len(values) == 0:
+            return list()
+        points = list()
+        for n in range(1, num_ranges):
+            value = values[(n * len(values)) // num_ranges]
+            if len(points) == 0 or value != points[-1]:
+                points.append(value)
+        return points
+
+    def range_filters(self, field, split_points):
+        # return the query_specs for the ranges delimited by the given split points.
+        # The first range is '$not $gte' rather than '$lt', so that it also includes
+        # the documents without the field or with a value of another BSON type,
+        # which no range query matches; it can still be bounded by an index.
+        filters, lower = list(), None
+        for point in list(split_points) + [None]:
+            spec = dict()
+            if lower != None:
+                spec['$gte'] = lower
+            if point != None:
+                if lower == None:
+                    spec['$not'] = {'$gte': point}
+                else:
+                    spec['$lt'] = point
+            filters.append({field: spec} if len(spec) > 0 else {})
+            lower = point
+        return filters
+
     def last_request_stats(self):
         return self._db.command({'getLastRequestStatistics': 1})
 
@@ -122,26 +366,28 @@ class Mongo(object):
 
 
 class MongoDBInstance:
+    """
+    The databases and collections of a MongoDB instance.  The inventory is
+    lazy - it is read on first access of the databases or collections
+    attributes, with the databases enumerated concurrently, and then cached
+    until refresh() is called.  Access to a single database or collection
+    via get_database() doesn't require the inventory.
+    """
 
-    def __init__(self, uri: str):
+    SYSTEM_DATABASES = ['admin', 'local', 'config']
+
+    def __init__(self, uri: str, opts: dict = None):
         self.uri = uri
         if 'cosmos.azure.com' in self.uri:
             self._env = 'cosmos'
         else:
             self._env = 'mongo'
         
-        self.client = MongoClient(uri, tlsCAFile=certifi.where())
-
-        self.databases = self.client.list_database_names()
-        if "admin" in self.databases:
-            self.databases.remove("admin")
-        if "local" in self.databases:
-            self.databases.remove("local")
-        if "config" in self.databases:
-            self.databases.remove("config")
-        self.collections = {}
-        for database in self.databases:
-            self.collections[database] = self.client[database].list_collection_names(filter={'type': 'collection'})
+        self.client = MongoClientRegistry.get(uri, opts)
+        self._inventory_workers = int((opts or dict()).get('inventory_workers', 8))
+        self._databases = None
+        self._collections = None
+        self._lock = threading.Lock()
 
         # optionally display and capture the list of databases and their collections
         # if the --list-dbs-and-colls command-line arg is provided
@@ -154,6 +400,34 @@ class MongoDBInstance:
                         print('env: {} db: {} coll: {}'.format(self._env, db_name, cname))
                         key = '{}|{}|{}'.format(self._env, db_name, cname)
 
+    @property
+    def databases(self):
+        with self._lock:
+            if self._databases == None:
+                names = self.client.list_database_names()
+                self._databases = [n for n in names if n not in self.SYSTEM_DATABASES]
+            return list(self._databases)
+
+    @property
+    def collections(self):
+        databases = self.databases
+        with self._lock:
+            if self._collections == None:
+                workers = max(1, min(self._inventory_workers, len(databases)))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    names = executor.map(self.list_collection_names, databases)
+                    self._collections = dict(zip(databases, names))
+            return dict(self._collections)
+
+    def list_collection_names(self, database_name: str):
+        return self.client[database_name].list_collection_names(filter={'type': 'collection'})
+
+    def refresh(self):
+        """ Discard the cached inventory; it is re-read on next access. """
+        with self._lock:
+            self._databases = None
+            self._collections = None
+
     def list_databases_and_collections(self):
         for arg in sys.argv:
             if arg == '--list-dbs-and-colls':
@@ -161,14 +435,25 @@ class MongoDBInstance:
         return False
         
     def get_database(self, database_name: str):
-        return MongoDBDatabase(self.client[database_name])
+        collections = None
+        with self._lock:
+            if self._collections != None:
+                collections = self._collections.get(database_name)
+        return MongoDBDatabase(self.client[database_name], collections)
 
 
 class MongoDBDatabase:
 
-    def __init__(self, database):
+    def __init__(self, database, collections=None):
         self.database = database
-        self.collections = self.database.list_collection_names(filter={'type': 'collection'})
+        self._collections = collections
+
+    @property
+    def collections(self):
+        # listed lazily, unless provided by the MongoDBInstance inventory
+        if self._collections == None:
+            self._collections = self.database.list_collection_names(filter={'type': 'collection'})
+        return self._collections
 
     def get_collection(self, collection_name: str):
         return MongoDBCollection(self.database, collection_name)
@@ -183,6 +468,9 @@ class MongoDBCollection:
         stats = database.database.command("collStats", self.collection.name)
         return stats['size']
 
+    def get_stats(self):
+        return self.collection.database.command("collStats", self.collection.name)
+
     def get_num_documents(self):
         return self.collection.estimated_document_count()
 
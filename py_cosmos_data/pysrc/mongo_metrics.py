@@ -0,0 +1,107 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+# This class is used to collect per-operation metrics for the Mongo class -
+# latency histograms, sampled CosmosDB request charges, and error counts,
+# by operation and collection.  It is opt-in; see the 'metrics' key of the
+# Mongo opts.  The metrics are periodically exported to a local JSON file,
+# and again at process exit.
+#
+# Chris Joakim, Microsoft
+
+class MongoMetrics(object):
+
+    # upper bounds, in milliseconds, of the latency histogram buckets
+    LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+    def __init__(self, opts):
+        self._opts = opts
+        self._outfile = opts.get('outfile', 'tmp/mongo_metrics.json')
+        self._export_interval = float(opts.get('export_interval', 30))
+        self._sample_every = int(opts.get('sample_every', 100))
+        self._lock = threading.Lock()
+        self._ops = dict()
+        self._start_time = time.time()
+        self._last_export = time.time()
+        self._count = 0
+        atexit.register(self.export)
+
+    def should_sample_charge(self):
+        return self._sample_every > 0 and (self._count % self._sample_every) == 0
+
+    def record(self, op, coll, ms, error=None):
+        key = '{}|{}'.format(op, coll)
+        with self._lock:
+            self._count = self._count + 1
+            if key not in self._ops:
+                m = dict()
+                m['op'], m['coll'] = op, coll
+                m['count'], m['errors'], m['total_ms'], m['max_ms'] = 0, 0, 0.0, 0.0
+                m['histogram'] = [0] * (len(self.LATENCY_BUCKETS_MS) + 1)
+                m['error_types'] = dict()
+                m['charge_samples'], m['charge_total'] = 0, 0.0
+                self._ops[key] = m
+            m = self._ops[key]
+            m['count'] = m['count'] + 1
+            m['total_ms'] = m['total_ms'] + ms
+            m['max_ms'] = max(m['max_ms'], ms)
+            m['histogram'][self.bucket_index(ms)] += 1
+            if error != None:
+                m['errors'] = m['errors'] + 1
+                name = type(error).__name__
+                m['error_types'][name] = m['error_types'].get(name, 0) + 1
+            export = (time.time() - self._last_export) >= self._export_interval
+        if export:
+            self.export()
+
+    def record_charge(self, op, coll, charge):
+        key = '{}|{}'.format(op, coll)
+        with self._lock:
+            if key in self._ops and charge >= 0:
+                m = self._ops[key]
+                m['charge_samples'] = m['charge_samples'] + 1
+                m['charge_total'] = m['charge_total'] + charge
+
+    def bucket_index(self, ms):
+        for idx, bound in enumerate(self.LATENCY_BUCKETS_MS):
+            if ms <= bound:
+                return idx
+        return len(self.LATENCY_BUCKETS_MS)
+
+    def snapshot(self):
+        with self._lock:
+            ops = list()
+            for key in sorted(self._ops.keys()):
+                m = dict(self._ops[key])
+                m['histogram'] = list(m['histogram'])
+                m['error_types'] = dict(m['error_types'])
+                m['avg_ms'] = round(m['total_ms'] / m['count'], 3) if m['count'] > 0 else 0.0
+                m['total_ms'] = round(m['total_ms'], 3)
+                m['max_ms'] = round(m['max_ms'], 3)
+                m['avg_charge'] = None
+                if m['charge_samples'] > 0:
+                    m['avg_charge'] = round(m['charge_total'] / m['charge_samples'], 2)
+                    # estimated total RU for the operation, from the sampled average
+                    m['est_total_charge'] = round(m['avg_charge'] * m['count'], 1)
+                ops.append(m)
+        data = dict()
+        data['epoch'] = int(time.time())
+        data['elapsed'] = round(time.time() - self._start_time, 3)
+        data['latency_buckets_ms'] = self.LATENCY_BUCKETS_MS + ['inf']
+        data['operations'] = ops
+        return data
+
+    def export(self):
+        data = self.snapshot()
+        with self._lock:
+            self._last_export = time.time()
+        try:
+            tmp = '{}.tmp'.format(self._outfile)
+            with open(tmp, 'wt') as f:
+                f.write(json.dumps(data, sort_keys=False, indent=2))
+            os.replace(tmp, self._outfile)
+        except Exception as e:
+            print('MongoMetrics - export failed: {}'.format(str(e)))
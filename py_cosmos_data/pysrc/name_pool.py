@@ -0,0 +1,29 @@
+import zlib
+
+from faker import Faker
+
+# This class is used to assign synthetic person names to documents, such as
+# the frequent_passengers of a route.  A pool of names is generated once with
+# a seeded Faker, then names are selected from the pool by hashing a document
+# key, so the assignments are fast, and identical across runs and processes.
+#
+# Chris Joakim, Microsoft
+
+class NamePool(object):
+
+    def __init__(self, size=10000, seed=42):
+        self._seed = int(seed)
+        Faker.seed(self._seed)
+        fake = Faker()
+        self._names = [fake.name() for n in range(max(1, int(size)))]
+
+    def size(self):
+        return len(self._names)
+
+    def names_for(self, key, count=3):
+        data = str(key).encode('utf-8')
+        names, size = list(), len(self._names)
+        for n in range(count):
+            idx = zlib.crc32(data, self._seed + n) % size
+            names.append(self._names[idx])
+        return names
@@ -0,0 +1,143 @@
+import random
+import re
+import threading
+import time
+
+# This class is used to pace writes to a CosmosDB Mongo API collection
+# so that they stay within a target RU/s budget, and to back off when the
+# service responds with a throttling (16500 / TooManyRequests) error.
+# The RU charge per document is estimated by periodically sampling
+# Mongo.last_request_request_charge(), which costs an extra round trip,
+# rather than sampling every request.
+#
+# Chris Joakim, Microsoft
+
+class RateGovernor(object):
+
+    THROTTLE_ERROR_CODE = 16500
+
+    def __init__(self, mongo, opts):
+        self._m = mongo
+        self._opts = opts
+        self._ru_per_sec = float(opts.get('ru_per_sec', 0))  # 0 -> no pacing
+        self._sample_every = int(opts.get('sample_every', 50))
+        self._max_retries = int(opts.get('max_retries', 10))
+        self._max_backoff = float(opts.get('max_backoff', 10.0))
+        self._ru_per_doc = float(opts.get('initial_ru_per_doc', 10.0))
+        self._rate_factor = 1.0
+        self._next_time = 0.0
+        self._requests = 0
+        self._sampling_enabled = True
+        self._lock = threading.Lock()
+        self._stats = dict()
+        self._stats['throttles'] = 0
+        self._stats['retries'] = 0
+        self._stats['samples'] = 0
+        self._stats['slept'] = 0.0
+
+    def execute(self, func, doc_count=1):
+        """
+        Invoke func() within the RU budget, retrying it if it is throttled.
+        """
+        attempt = 0
+        while True:
+            self.pace(doc_count)
+            try:
+                result = func()
+                self.record(doc_count)
+                return result
+            except Exception as e:
+                if self.is_throttled(e) and attempt < self._max_retries:
+                    attempt = attempt + 1
+                    self.backoff(attempt, e)
+                else:
+                    raise
+
+    def pace(self, doc_count):
+        if self._ru_per_sec <= 0:
+            return
+        with self._lock:
+            now = time.time()
+            estimated_ru = doc_count * self._ru_per_doc
+            budget = self._ru_per_sec * self._rate_factor
+            start = max(now, self._next_time)
+            self._next_time = start + (estimated_ru / budget)
+            delay = start - now
+        if delay > 0:
+            self.sleep(delay)
+
+    def record(self, doc_count):
+        with self._lock:
+            self._requests = self._requests + 1
+            # recover slowly toward the full budget after a throttle
+            self._rate_factor = min(1.0, self._rate_factor * 1.01)
+            # the ru_per_doc estimate is only used for pacing, so don't sample without it
+            sample = self._ru_per_sec > 0 and self._sampling_enabled and \
+                (self._requests % self._sample_every == 0)
+        if sample:
+            self.sample_request_charge(doc_count)
+
+    def sample_request_charge(self, doc_count):
+        # getLastRequestStatistics is per-connection, so with concurrent workers
+        # a sample may occasionally reflect another batch
+        try:
+            charge = float(self._m.last_request_request_charge())
+        except Exception as e:
+            # getLastRequestStatistics is CosmosDB-specific; disable on vanilla MongoDB
+            print('RateGovernor - request charge sampling disabled: {}'.format(str(e)))
+            self._sampling_enabled = False
+            return
+        if charge > 0 and doc_count > 0:
+            with self._lock:
+                self._stats['samples'] = self._stats['samples'] + 1
+                observed = charge / doc_count
+                self._ru_per_doc = (0.7 * self._ru_per_doc) + (0.3 * observed)
+
+    def is_throttled(self, e):
+        code = getattr(e, 'code', None)
+        if code == self.THROTTLE_ERROR_CODE:
+            return True
+        msg = str(e)
+        return ('TooManyRequests' in msg) or ('Request rate is large' in msg)
+
+    def is_throttled_write_error(self, write_error):
+        if write_error.get('code') == self.THROTTLE_ERROR_CODE:
+            return True
+        msg = str(write_error.get('errmsg', ''))
+        return ('TooManyRequests' in msg) or ('Request rate is large' in msg)
+
+    def backoff(self, attempt, e=None):
+        with self._lock:
+            self._stats['throttles'] = self._stats['throttles'] + 1
+            self._stats['retries'] = self._stats['retries'] + 1
+            self._rate_factor = max(0.1, self._rate_factor * 0.8)
+        delay = self.retry_after_seconds(e)
+        if delay == None:
+            delay = min(self._max_backoff, 0.1 * pow(2, attempt))
+            delay = delay * random.uniform(0.5, 1.0)
+        self.sleep(delay)
+
+    def retry_after_seconds(self, e):
+        # CosmosDB includes a 'RetryAfterMs=nnn' hint in the 16500 error message
+        if e == None:
+            return None
+        match = re.search(r'RetryAfterMs=(\d+)', str(e))
+        if match:
+            return min(self._max_backoff, int(match.group(1)) / 1000.0)
+        return None
+
+    def max_retries(self):
+        return self._max_retries
+
+    def sleep(self, seconds):
+        with self._lock:
+            self._stats['slept'] = self._stats['slept'] + seconds
+        time.sleep(seconds)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['slept'] = round(s['slept'], 3)
+            s['ru_per_doc'] = round(self._ru_per_doc, 2)
+            s['rate_factor'] = round(self._rate_factor, 3)
+            return s
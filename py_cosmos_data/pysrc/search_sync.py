@@ -0,0 +1,213 @@
+import base64
+import json
+import os
+import time
+
+import requests
+
+from bson import json_util
+
+from pysrc.fs import FS
+
+# This class is used to push changes in a MongoDB/CosmosDB collection into an
+# Azure Cognitive Search index in near-real-time, as an alternative to waiting
+# for the scheduled pull indexer.  It consumes the change stream of the
+# collection, batches the changed documents, and sends them to the index push
+# API (/indexes/{name}/docs/index) as mergeOrUpload and delete actions.  The
+# resume token is persisted only after a batch is accepted by the index, so
+# that a restarted sync continues where it stopped; if a batch fails the sync
+# stops, and the next run replays the changes of that batch.
+#
+# Note that the CosmosDB Mongo API change stream doesn't report deletes, and
+# requires the restricted pipeline used below; a replica-set mongod does.
+# The documents are keyed by their base64 encoded _id, whereas the scheduled
+# indexers key them by the CosmosDB _rid; so push to an index which is not
+# also populated by an indexer, or each document is indexed twice.
+#
+# Chris Joakim, Microsoft
+
+class ChangeStreamSearchSync(object):
+
+    MAX_BATCH_SIZE = 1000  # the push API limit of documents per request
+
+    def __init__(self, mongo, opts):
+        self._m = mongo
+        self._opts = opts
+        self._index_name = opts['index_name']
+        self._search_url = opts['search_url'].rstrip('/')
+        self._api_key = opts['search_admin_key']
+        self._api_version = opts.get('api_version', '2021-04-30-Preview')
+        self._key_field = opts.get('key_field', 'id')
+        self._batch_size = min(int(opts.get('batch_size', 500)), self.MAX_BATCH_SIZE)
+        self._max_wait = float(opts.get('max_wait', 2.0))
+        self._max_retries = int(opts.get('max_retries', 5))
+        self._state_file = opts['state_file']
+        self._schema_fields = self.read_schema_fields(opts.get('index_schema', None))
+        self._session = requests.Session()
+        self._stats = {'changes': 0, 'uploaded': 0, 'deleted': 0, 'failed': 0, 'batches': 0}
+
+    def run(self, max_changes=None):
+        """ Consume the change stream until interrupted, or until max_changes. """
+        token = self.read_resume_token()
+        print('search_sync - index: {}, resume_token: {}'.format(self._index_name, token))
+        pending, last_token, first_time = dict(), None, None
+        with self._m.watch(self.pipeline(), token) as stream:
+            while stream.alive:
+                change = stream.try_next()
+                if change != None:
+                    self._stats['changes'] = self._stats['changes'] + 1
+                    action = self.index_action(change)
+                    if action != None:
+                        # only the latest action for a given document key is kept
+                        pending[action[self._key_field]] = action
+                    last_token = stream.resume_token
+                    if first_time == None:
+                        first_time = time.time()
+                waited = (time.time() - first_time) if first_time != None else 0
+                if len(pending) >= self._batch_size or (last_token != None and waited >= self._max_wait):
+                    if not self.push(list(pending.values())):
+                        return self.stopped()
+                    self.write_resume_token(last_token)
+                    pending, last_token, first_time = dict(), None, None
+                if max_changes != None and self._stats['changes'] >= max_changes:
+                    break
+                if change == None:
+                    time.sleep(0.1)
+            if last_token != None:
+                if not self.push(list(pending.values())):
+                    return self.stopped()
+                self.write_resume_token(last_token)
+        return self.stats()
+
+    def stopped(self):
+        # the resume token isn't advanced past a batch which wasn't accepted,
+        # so the next run replays its changes
+        print('search_sync - stopped; the batch was not accepted by the index')
+        s = self.stats()
+        s['stopped'] = True
+        return s
+
+    def pipeline(self):
+        if self._m.is_cosmos():
+            return [
+                {'$match': {'operationType': {'$in': ['insert', 'update', 'replace']}}},
+                {'$project': {'_id': 1, 'fullDocument': 1, 'ns': 1, 'documentKey': 1}}
+            ]
+        return [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}]
+
+    def index_action(self, change):
+        op = change.get('operationType', 'update')  # not projected by CosmosDB
+        doc_id = change['documentKey']['_id']
+        if op == 'delete':
+            return {'@search.action': 'delete', self._key_field: self.document_key(doc_id)}
+        doc = change.get('fullDocument')
+        if doc == None:
+            return None  # the document was deleted before the update lookup
+        action = self.project(doc, self._schema_fields)
+        action['@search.action'] = 'mergeOrUpload'
+        action[self._key_field] = self.document_key(doc_id)
+        action['doc_id'] = str(doc_id)
+        return action
+
+    def document_key(self, doc_id):
+        # index keys may only contain letters, digits, '_', '-' and '='
+        return base64.urlsafe_b64encode(str(doc_id).encode('utf-8')).decode('ascii')
+
+    def project(self, doc, fields):
+        # include only the fields defined in the index schema, if one is given
+        if fields == None:
+            return {k: self.json_value(v) for k, v in doc.items() if k != '_id'}
+        projected = dict()
+        for name, subfields in fields.items():
+            if name in doc:
+                value = doc[name]
+                if subfields != None and isinstance(value, dict):
+                    value = self.project(value, subfields)
+                elif subfields != None and isinstance(value, list):
+                    value = [self.project(v, subfields) for v in value if isinstance(v, dict)]
+                projected[name] = self.json_value(value)
+        return projected
+
+    def json_value(self, value):
+        if isinstance(value, (str, int, float, bool, list, dict)) or value == None:
+            return value
+        return str(value)  # ObjectId, datetime, etc
+
+    def read_schema_fields(self, schema_file):
+        # returns {field_name: None or {subfield_name: ...}} for complex types
+        if schema_file == None:
+            return None
+        def fields_dict(fields):
+            d = dict()
+            for field in fields:
+                d[field['name']] = fields_dict(field['fields']) if 'fields' in field else None
+            return d
+        fields = fields_dict(FS.read_json(schema_file)['fields'])
+        fields.pop(self._key_field, None)
+        fields.pop('doc_id', None)
+        return fields
+
+    def push(self, actions):
+        """
+        Push the actions, return True if the batch was accepted.  Documents which
+        the index rejects with a non-retryable status are counted and skipped.
+        """
+        if len(actions) == 0:
+            return True
+        accepted = True
+        self._stats['batches'] = self._stats['batches'] + 1
+        url = '{}/indexes/{}/docs/index?api-version={}'.format(
+            self._search_url, self._index_name, self._api_version)
+        headers = {'Content-Type': 'application/json', 'api-key': self._api_key}
+        attempt = 0
+        while len(actions) > 0:
+            r = self._session.post(url=url, headers=headers, data=json.dumps({'value': actions}))
+            retry = list()
+            if r.status_code in [200, 207]:
+                by_key = {a[self._key_field]: a for a in actions}
+                for item in r.json().get('value', list()):
+                    action = by_key.get(item.get('key'))
+                    if item.get('status', False) or action == None:
+                        if action != None and action['@search.action'] == 'delete':
+                            self._stats['deleted'] = self._stats['deleted'] + 1
+                        else:
+                            self._stats['uploaded'] = self._stats['uploaded'] + 1
+                    elif item.get('statusCode') in [409, 422, 503]:
+                        retry.append(action)
+                    else:
+                        self._stats['failed'] = self._stats['failed'] + 1
+                        print('search_sync - key {} failed: {} {}'.format(
+                            item.get('key'), item.get('statusCode'), item.get('errorMessage')))
+            elif r.status_code in [429, 503]:
+                retry = actions
+            else:
+                self._stats['failed'] = self._stats['failed'] + len(actions)
+                print('search_sync - push failed: {} {}'.format(r.status_code, r.text))
+                return False
+            if len(retry) > 0 and attempt < self._max_retries:
+                attempt = attempt + 1
+                time.sleep(min(10.0, 0.5 * pow(2, attempt)))
+                actions = retry
+            else:
+                if len(retry) > 0:
+                    self._stats['failed'] = self._stats['failed'] + len(retry)
+                    accepted = False
+                actions = list()
+        print('search_sync - {}'.format(self.stats()))
+        return accepted
+
+    def read_resume_token(self):
+        # the token may contain BSON types, hence json_util rather than json
+        if os.path.exists(self._state_file):
+            with open(self._state_file, 'rt') as f:
+                return json_util.loads(f.read()).get('resume_token')
+        return None
+
+    def write_resume_token(self, token):
+        tmp = '{}.tmp'.format(self._state_file)
+        with open(tmp, 'wt') as f:
+            f.write(json_util.dumps({'resume_token': token}))
+        os.replace(tmp, self._state_file)
+
+    def stats(self):
+        return dict(self._stats)
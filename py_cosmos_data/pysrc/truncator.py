@@ -0,0 +1,103 @@
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+# This class is used to delete all documents in a MongoDB/CosmosDB collection.
+# Documents are deleted in batches of _ids with delete_many, optionally with
+# several threads each deleting a range of partition key values.  Progress is
+# reported with estimated_document_count, which is much cheaper than a full
+# count_documents.  When allowed, the collection is instead dropped and
+# recreated with the same shard key, throughput and indexes.
+#
+# Chris Joakim, Microsoft
+
+class Truncator(object):
+
+    def __init__(self, mongo, opts):
+        self._m = mongo
+        self._opts = opts
+        self._cname = opts['cname']
+        self._batch_size = int(opts.get('batch_size', 1000))
+        self._workers = max(1, int(opts.get('workers', 1)))
+        self._partition_key = opts.get('partition_key', 'pk')
+        self._progress_interval = int(opts.get('progress_interval', 10))
+        self._allow_drop = opts.get('allow_drop', False)
+        self._governor = opts.get('governor', None)  # optional RateGovernor
+        self._lock = threading.Lock()
+        self._stats = dict()
+        self._stats['deleted'] = 0
+        self._stats['batches'] = 0
+        self._start_time = None
+
+    def truncate(self):
+        self._start_time = time.time()
+        if self._allow_drop:
+            self.drop_and_recreate()
+        elif self._workers > 1:
+            splits = self._m.sample_split_points(self._partition_key, self._workers)
+            filters = self._m.range_filters(self._partition_key, splits)
+            print('truncate - {} workers, {} {} ranges'.format(
+                self._workers, len(filters), self._partition_key))
+            with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                list(executor.map(self.delete_range, filters))
+            # sweep any documents without the partition key field
+            self.delete_range({})
+        else:
+            self.delete_range({})
+        return self.stats()
+
+    def delete_range(self, query_spec):
+        while True:
+            ids = self._m.find_ids(query_spec, self._batch_size)
+            if len(ids) == 0:
+                return
+            if self._governor != None:
+                result = self._governor.execute(lambda: self._m.delete_by_ids(ids), len(ids))
+            else:
+                result = self._m.delete_by_ids(ids)
+            with self._lock:
+                self._stats['deleted'] = self._stats['deleted'] + result.deleted_count
+                self._stats['batches'] = self._stats['batches'] + 1
+                report = (self._stats['batches'] % self._progress_interval) == 0
+            if report:
+                self.log_progress()
+
+    def drop_and_recreate(self):
+        indexes = self._m.get_coll_indexes(self._cname) or dict()
+        if self._m.is_cosmos():
+            md = self._m.get_cosmos_coll_metadata(self._cname)
+            shard_key, throughput, autoscale_max = None, None, None
+            if 'shardKeyDefinition' in md:
+                shard_key = list(md['shardKeyDefinition'].keys())[0]
+            if 'autoScaleSettings' in md:
+                autoscale_max = md['autoScaleSettings'].get('maxThroughput')
+            elif 'provisionedThroughput' in md:
+                throughput = md['provisionedThroughput']
+            self._stats['deleted'] = self._m.estimated_count()
+            self._m.drop_coll(self._cname)
+            self._m.create_cosmos_coll(self._cname, shard_key, throughput, autoscale_max)
+            print('truncate - dropped and recreated {}; shard_key: {}, throughput: {}, autoscale_max: {}'.format(
+                self._cname, shard_key, throughput, autoscale_max))
+        else:
+            self._stats['deleted'] = self._m.estimated_count()
+            self._m.drop_coll(self._cname)
+            print('truncate - dropped {}'.format(self._cname))
+        coll = self._m.set_coll(self._cname)
+        for name, info in indexes.items():
+            if name != '_id_':
+                # keep the options, such as expireAfterSeconds, sparse and partialFilterExpression
+                options = {k: v for k, v in info.items() if k not in ('key', 'v', 'ns')}
+                coll.create_index(info['key'], name=name, **options)
+                print('truncate - recreated index {}'.format(name))
+
+    def log_progress(self):
+        s = self.stats()
+        print('truncate - batches: {}, deleted: {}, estimated remaining: {}, elapsed: {}'.format(
+            s['batches'], s['deleted'], self._m.estimated_count(), s['elapsed']))
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        s['elapsed'] = round(time.time() - self._start_time, 3) if self._start_time != None else 0.0
+        return s